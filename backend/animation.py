@@ -0,0 +1,242 @@
+from PIL import Image, GifImagePlugin
+import os
+import queue
+import threading
+
+import numpy as np
+
+from backend.postprocessing import PLATFORM_SIZES, cover_box, cover_resize, overlay_text
+
+
+MOTIONS = ("zoom", "pan", "none")
+ANIMATION_FORMATS = ("gif", "webp", "mp4")
+
+DEFAULT_FPS = 15
+DEFAULT_DURATION = 3.0
+DEFAULT_FADE = 0.8
+DEFAULT_ZOOM = 1.12
+FRAME_QUEUE_SIZE = 4
+
+
+def build_pyramid(image, min_size):
+    """
+    Halve the image repeatedly while it still covers min_size (w, h).
+    Returns levels from full resolution down, each as (image, scale).
+    """
+    levels = [(image, 1.0)]
+    while True:
+        img, scale = levels[-1]
+        if img.width // 2 < min_size[0] or img.height // 2 < min_size[1]:
+            return levels
+        levels.append((img.reduce(2), scale / 2))
+
+
+def frame_boxes(src_size, out_size, frames, motion="zoom", zoom=DEFAULT_ZOOM):
+    """
+    Crop box (x0, y0, x1, y1) in source pixels for every frame.
+    """
+    src_w, src_h = src_size
+    W, H = out_size
+    cx0, cy0, cx1, cy1 = cover_box(src_w, src_h, W, H)
+    cw, ch = cx1 - cx0, cy1 - cy0
+    t = np.linspace(0.0, 1.0, frames) if frames > 1 else np.zeros(1)
+
+    if motion == "zoom":
+        # ease in slowly from the full cover box to 1/zoom of it
+        factor = 1.0 + (zoom - 1.0) * (3 * t ** 2 - 2 * t ** 3)
+        bw, bh = cw / factor, ch / factor
+        x0 = cx0 + (cw - bw) / 2
+        y0 = cy0 + (ch - bh) / 2
+    elif motion == "pan":
+        bw = np.full_like(t, cw / zoom)
+        bh = np.full_like(t, ch / zoom)
+        x0 = cx0 + (cw - bw) * t
+        y0 = np.full_like(t, cy0 + (ch - bh[0]) / 2)
+    else:
+        bw, bh = np.full_like(t, cw), np.full_like(t, ch)
+        x0, y0 = np.full_like(t, cx0), np.full_like(t, cy0)
+
+    return np.stack([x0, y0, x0 + bw, y0 + bh], axis=1)
+
+
+def _render_frames(pyramid, boxes, out_size, layer, fade_frames):
+    layer_alpha = layer.getchannel("A")
+    W, H = out_size
+
+    for i, box in enumerate(boxes):
+        # smallest pyramid level that still has at least output resolution for this crop
+        level, scale = pyramid[0]
+        for img, s in pyramid:
+            if (box[2] - box[0]) * s >= W and (box[3] - box[1]) * s >= H:
+                level, scale = img, s
+        frame = level.resize(out_size, Image.BILINEAR, box=tuple(box * scale)).convert("RGBA")
+
+        if i < fade_frames:
+            opacity = (i + 1) / (fade_frames + 1)
+            faded = layer.copy()
+            faded.putalpha(layer_alpha.point(lambda v: int(v * opacity)))
+            frame.alpha_composite(faded)
+        else:
+            frame.alpha_composite(layer)
+
+        yield frame.convert("RGB")
+
+
+class _GifStreamWriter:
+    # writes frames as they arrive, so memory does not grow with frame count
+    def __init__(self, path, fps):
+        self._fp = open(path, "wb")
+        self._duration = int(round(1000 / fps))
+        self._first = True
+
+    def add(self, frame):
+        paletted = frame.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        if self._first:
+            header, _ = GifImagePlugin.getheader(paletted, info={"loop": 0})
+            for chunk in header:
+                self._fp.write(chunk)
+            params = {"duration": self._duration}
+            self._first = False
+        else:
+            params = {"duration": self._duration, "include_color_table": True}
+        for chunk in GifImagePlugin.getdata(paletted, **params):
+            self._fp.write(chunk)
+
+    def close(self):
+        self._fp.write(b";")
+        self._fp.close()
+
+
+class _Mp4StreamWriter:
+    def __init__(self, path, fps, size):
+        import cv2  # only needed for video export
+
+        self._cv2 = cv2
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+        if not self._writer.isOpened():
+            raise RuntimeError(f"OpenCV could not open a video writer for {path}")
+
+    def add(self, frame):
+        self._writer.write(self._cv2.cvtColor(np.asarray(frame), self._cv2.COLOR_RGB2BGR))
+
+    def close(self):
+        self._writer.release()
+
+
+class _WebpWriter:
+    # Pillow's animated WebP encoder takes the whole frame list at once,
+    # so WebP export (unlike GIF and MP4) holds every frame in memory.
+    def __init__(self, path, fps):
+        self._path = path
+        self._duration = int(round(1000 / fps))
+        self._frames = []
+
+    def add(self, frame):
+        self._frames.append(frame)
+
+    def close(self):
+        if not self._frames:
+            return
+        first, *rest = self._frames
+        first.save(self._path, format="WEBP", save_all=True, append_images=rest,
+                   duration=self._duration, loop=0, quality=80)
+
+
+def export_animated(base_image, title, subtitle, title_font_path, subtitle_font_path, variant,
+                    out_path, platform="Instagram", motion="zoom", duration=DEFAULT_DURATION,
+                    fps=DEFAULT_FPS, fade=DEFAULT_FADE, zoom=DEFAULT_ZOOM, fmt=None):
+    """
+    Export a motion poster (slow zoom or pan with the text fading in).
+
+    The text layout and glyph layers are computed once, on the first frame,
+    through overlay_text(text_layer=True). Background frames are cropped
+    and resized from a mip pyramid of the single decoded background. A
+    producer thread renders frames into a small bounded queue while this
+    thread encodes them, so GIF and MP4 exports keep memory constant in
+    frame count. Returns (out_path, metadata).
+    """
+    fmt = (fmt or os.path.splitext(out_path)[1].lstrip(".")).lower()
+    if fmt not in ANIMATION_FORMATS:
+        raise ValueError(f"unsupported animation format: {fmt!r}")
+    if motion not in MOTIONS:
+        raise ValueError(f"unsupported motion: {motion!r}")
+
+    out_size = PLATFORM_SIZES.get(platform, PLATFORM_SIZES["Instagram"])
+    frames = max(1, int(round(duration * fps)))
+    fade_frames = min(frames, int(round(fade * fps)))
+
+    base_image = base_image.convert("RGB")
+    boxes = frame_boxes(base_image.size, out_size, frames, motion, zoom)
+    pyramid = build_pyramid(base_image, out_size)
+
+    # layout once, against the opening frame
+    first_frame = cover_resize(base_image, *out_size)
+    variant_with_platform = dict(variant or {}, platform=platform)
+    layer, metadata = overlay_text(
+        first_frame,
+        title=title,
+        subtitle=subtitle,
+        title_font_path=title_font_path,
+        subtitle_font_path=subtitle_font_path,
+        variant=variant_with_platform,
+        text_layer=True,
+    )
+    if layer.size != out_size:
+        # overlay_text upsizes small canvases; bring the layer back to the output size
+        layer = layer.resize(out_size, Image.LANCZOS)
+
+    if fmt == "gif":
+        writer = _GifStreamWriter(out_path, fps)
+    elif fmt == "mp4":
+        writer = _Mp4StreamWriter(out_path, fps, out_size)
+    else:
+        writer = _WebpWriter(out_path, fps)
+
+    frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    done = object()
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for frame in _render_frames(pyramid, boxes, out_size, layer, fade_frames):
+                if stop.is_set():
+                    break
+                frame_queue.put(frame)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            frame_queue.put(done)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            frame = frame_queue.get()
+            if frame is done:
+                break
+            writer.add(frame)
+    finally:
+        # if encoding failed, unblock the producer before waiting for it
+        stop.set()
+        while producer.is_alive():
+            try:
+                frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+        writer.close()
+
+    if errors:
+        raise errors[0]
+
+    metadata.update({
+        "animation": {
+            "format": fmt,
+            "motion": motion,
+            "frames": frames,
+            "fps": fps,
+            "size": list(out_size),
+        }
+    })
+    return out_path, metadata
@@ -0,0 +1,369 @@
+from collections import OrderedDict
+from PIL import Image
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+from backend.layout import LayoutStats
+from backend.output_sink import atomic_write
+from backend.postprocessing import PLATFORM_SIZES, cover_resize, overlay_text
+
+
+# "original" renders onto the background as-is; the rest are PLATFORM_SIZES crops
+ORIGINAL = "original"
+BACKGROUND_CACHE_SIZE = 8
+INDEX_PATTERN = "index-shard-{shard:03d}-of-{shards:03d}.jsonl"
+CATALOG_FILENAME = "catalog.json"
+
+
+def _canonical(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def job_id(job):
+    """
+    Stable id for a job: its "id" field, or a hash of its content, so the
+    same job always gets the same id (and shard) on every node.
+    """
+    if job.get("id"):
+        return str(job["id"])
+    return hashlib.sha1(_canonical(job).encode("utf-8")).hexdigest()[:16]
+
+
+def shard_of(jid, shards):
+    return int(hashlib.sha1(jid.encode("utf-8")).hexdigest()[:8], 16) % shards
+
+
+PATH_KEYS = ("background", "title_font", "subtitle_font")
+
+
+def load_manifest(path):
+    """
+    Read a manifest: JSON Lines, one job per line, or a JSON object with a
+    "jobs" list and optional "defaults" merged into every job. A job has
+    background, title, subtitle, title_font, subtitle_font, variant (a
+    models.VARIANTS name or a dict) and platforms (default ["original"]).
+    Paths are kept as written; relative ones are resolved against the
+    manifest's directory only when a node renders (see resolve_paths).
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # more than one line of JSON: JSON Lines
+        data = None
+    if isinstance(data, dict) and "jobs" in data:
+        defaults = data.get("defaults", {})
+        jobs = [dict(defaults, **job) for job in data["jobs"]]
+    else:
+        jobs = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    for job in jobs:
+        job["id"] = job_id(job)
+    return jobs
+
+
+def resolve_paths(job, base_dir):
+    """
+    Copy of job with relative paths joined to base_dir (the directory of
+    the manifest this node read).
+    """
+    job = dict(job)
+    for key in PATH_KEYS:
+        value = job.get(key)
+        if value and not os.path.isabs(value):
+            job[key] = os.path.join(base_dir, value)
+    return job
+
+
+def _rebase_paths(job, from_dir, to_dir):
+    # keep relative paths relative, but to a manifest written in another directory
+    job = dict(job)
+    for key in PATH_KEYS:
+        value = job.get(key)
+        if value and not os.path.isabs(value):
+            job[key] = os.path.relpath(os.path.join(from_dir, value), to_dir)
+    return job
+
+
+def split_manifest(jobs, shards):
+    """
+    Deterministically assign jobs to shards. Returns a list of job lists.
+    """
+    out = [[] for _ in range(shards)]
+    for job in jobs:
+        out[shard_of(job["id"], shards)].append(job)
+    return out
+
+
+def _resolve_variant(variant):
+    if isinstance(variant, dict) or variant is None:
+        return variant or {}
+    # only named variants need the model module (and its heavy imports)
+    from backend.models import VARIANTS
+
+    for v in VARIANTS:
+        if v["name"] == variant:
+            return dict(v)
+    raise ValueError(f"unknown variant: {variant!r}")
+
+
+class _BackgroundCache:
+    # decoded backgrounds and their layout analysis, reused across a shard's jobs
+    def __init__(self, max_entries=BACKGROUND_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, path):
+        entry = self._entries.get(path)
+        if entry is None:
+            with Image.open(path) as img:
+                image = img.convert("RGB")
+            entry = (image, LayoutStats(image))
+            self._entries[path] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(path)
+        return entry
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _complete(record, out_dir, verify):
+    for output in record["outputs"]:
+        path = os.path.join(out_dir, output["path"])
+        try:
+            if os.path.getsize(path) != output["bytes"]:
+                return False
+        except OSError:
+            return False
+        if verify and _file_sha256(path) != output["sha256"]:
+            return False
+    return True
+
+
+def _read_index(path):
+    records = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn last line from an interrupted run
+                    continue
+                records[record["id"]] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def render_job(job, out_dir, backgrounds, base_dir="."):
+    """
+    Render every platform of one job into out_dir/<job id>/, resolving its
+    relative paths against base_dir. Returns the job's index record
+    (outputs with sizes and checksums, metadata, and the job as written).
+    """
+    record_job, job = job, resolve_paths(job, base_dir)
+    image, stats = backgrounds.get(job["background"])
+    variant = _resolve_variant(job.get("variant"))
+    job_dir = os.path.join(out_dir, job["id"])
+    os.makedirs(job_dir, exist_ok=True)
+
+    outputs, metadata = [], {}
+    start = time.perf_counter()
+    for platform in job.get("platforms") or [ORIGINAL]:
+        if platform == ORIGINAL:
+            canvas, canvas_stats, platform_variant = image, stats, variant
+        else:
+            W, H = PLATFORM_SIZES[platform]
+            canvas = cover_resize(image, W, H)
+            canvas_stats = None
+            platform_variant = dict(variant, platform=platform)
+
+        rendered, meta = overlay_text(
+            canvas,
+            title=job.get("title", ""),
+            subtitle=job.get("subtitle", ""),
+            title_font_path=job.get("title_font"),
+            subtitle_font_path=job.get("subtitle_font"),
+            variant=platform_variant,
+            layout_stats=canvas_stats,
+        )
+
+        buf = io.BytesIO()
+        rendered.save(buf, format="PNG")
+        data = buf.getvalue()
+        rel_path = os.path.join(job["id"], f"{platform.lower()}.png")
+        atomic_write(os.path.join(out_dir, rel_path), data)
+
+        outputs.append({
+            "platform": platform,
+            "path": rel_path,
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        })
+        metadata[platform] = {k: v for k, v in meta.items() if k not in ("layout_candidates", "line_styles")}
+
+    return {
+        "id": job["id"],
+        "job": record_job,
+        "outputs": outputs,
+        "metadata": metadata,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def render_shard(jobs, shard, shards, out_dir, base_dir=".", verify=False, log=print):
+    """
+    Render this node's shard of jobs (relative paths resolved against
+    base_dir), skipping jobs whose outputs are already complete in out_dir. Each finished job is appended to the
+    shard's index right away, so an interrupted shard resumes where it
+    stopped. Returns (rendered, skipped) counts.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, INDEX_PATTERN.format(shard=shard, shards=shards))
+    done = _read_index(index_path)
+
+    mine = split_manifest(jobs, shards)[shard]
+    # group by background so the cache sees each one in a single run
+    mine.sort(key=lambda job: (job["background"], job["id"]))
+
+    backgrounds = _BackgroundCache()
+    rendered = skipped = 0
+    with open(index_path, "a", encoding="utf-8") as index:
+        for job in mine:
+            record = done.get(job["id"])
+            if record is not None and _complete(record, out_dir, verify):
+                skipped += 1
+                continue
+            record = render_job(job, out_dir, backgrounds, base_dir)
+            index.write(_canonical(record) + "\n")
+            index.flush()
+            rendered += 1
+            log(f"shard {shard}/{shards}: {job['id']} ({record['seconds']}s)")
+    return rendered, skipped
+
+
+def merge_indexes(out_dir, jobs=None, verify=False):
+    """
+    Merge every shard index in out_dir into one catalog (written to
+    out_dir/catalog.json and returned). With the manifest's jobs, jobs with
+    no complete record are listed under "missing".
+    """
+    records, shard_info = {}, {}
+    for path in sorted(glob.glob(os.path.join(out_dir, "index-shard-*.jsonl"))):
+        shard_records = _read_index(path)
+        shard_info[os.path.basename(path)] = {"jobs": len(shard_records), "sha256": _file_sha256(path)}
+        for jid, record in shard_records.items():
+            if _complete(record, out_dir, verify):
+                records[jid] = record
+
+    catalog = {
+        "jobs": {jid: records[jid] for jid in sorted(records)},
+        "shards": shard_info,
+        "outputs": sum(len(r["outputs"]) for r in records.values()),
+    }
+    if jobs is not None:
+        catalog["missing"] = sorted(job["id"] for job in jobs if job["id"] not in records)
+
+    atomic_write(os.path.join(out_dir, CATALOG_FILENAME), _canonical(catalog).encode("utf-8"))
+    return catalog
+
+
+def run_local(manifest_path, shards, out_dir, verify=False):
+    """
+    Stand-in for a multi-node run: one local process per shard, then merge.
+    """
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo_root, os.environ.get("PYTHONPATH")])))
+    procs = []
+    for shard in range(shards):
+        cmd = [sys.executable, "-m", "backend.batch", "render", manifest_path,
+               "--shard", f"{shard}/{shards}", "--out", out_dir]
+        if verify:
+            cmd.append("--verify")
+        procs.append(subprocess.Popen(cmd, env=env))
+
+    failed = [shard for shard, proc in enumerate(procs) if proc.wait() != 0]
+    if failed:
+        raise RuntimeError(f"shards failed: {failed}")
+    return merge_indexes(out_dir, load_manifest(manifest_path), verify)
+
+
+def _parse_shard(value):
+    shard, shards = (int(v) for v in value.split("/"))
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f"shard must be in 0..{shards - 1}")
+    return shard, shards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded batch rendering of poster manifests.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split = commands.add_parser("split", help="write one manifest per shard")
+    split.add_argument("manifest")
+    split.add_argument("--shards", type=int, required=True)
+    split.add_argument("--out", required=True)
+
+    render = commands.add_parser("render", help="render one shard (one node)")
+    render.add_argument("manifest")
+    render.add_argument("--shard", type=_parse_shard, default=(0, 1), help="i/n, e.g. 2/4")
+    render.add_argument("--out", required=True)
+    render.add_argument("--verify", action="store_true", help="checksum existing outputs before skipping")
+
+    merge = commands.add_parser("merge", help="merge shard indexes into one catalog")
+    merge.add_argument("out")
+    merge.add_argument("--manifest", help="report jobs that have no complete output")
+    merge.add_argument("--verify", action="store_true")
+
+    local = commands.add_parser("run-local", help="render all shards as local processes, then merge")
+    local.add_argument("manifest")
+    local.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    local.add_argument("--out", required=True)
+    local.add_argument("--verify", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "split":
+        os.makedirs(args.out, exist_ok=True)
+        manifest_dir = os.path.dirname(os.path.abspath(args.manifest))
+        for shard, jobs in enumerate(split_manifest(load_manifest(args.manifest), args.shards)):
+            path = os.path.join(args.out, f"shard-{shard:03d}-of-{args.shards:03d}.jsonl")
+            jobs = [_rebase_paths(job, manifest_dir, os.path.abspath(args.out)) for job in jobs]
+            atomic_write(path, "".join(_canonical(job) + "\n" for job in jobs).encode("utf-8"))
+            print(f"{path}: {len(jobs)} jobs")
+    elif args.command == "render":
+        shard, shards = args.shard
+        rendered, skipped = render_shard(load_manifest(args.manifest), shard, shards, args.out,
+                                         base_dir=os.path.dirname(os.path.abspath(args.manifest)),
+                                         verify=args.verify, log=lambda line: print(line, file=sys.stderr))
+        print(f"shard {shard}/{shards}: rendered {rendered}, skipped {skipped}")
+    else:
+        if args.command == "merge":
+            jobs = load_manifest(args.manifest) if args.manifest else None
+            catalog = merge_indexes(args.out, jobs, args.verify)
+        else:
+            catalog = run_local(args.manifest, args.shards, args.out, args.verify)
+        print(f"{len(catalog['jobs'])} jobs, {catalog['outputs']} outputs, "
+              f"{len(catalog.get('missing', []))} missing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import copy
+import math
+
+import torch
+
+
+DEFAULT_VARIATION_STRENGTH = 0.3
+
+
+class LatentCheckpoint:
+    """
+    Denoising state captured partway through a generation: the latents after
+    `step` scheduler steps, a copy of the scheduler (multistep schedulers
+    keep history between steps) and the settings needed to finish the run.
+    """
+
+    def __init__(self, prompt, guidance_scale, num_steps, step, latents, scheduler, seed=None):
+        self.prompt = prompt
+        self.guidance_scale = guidance_scale
+        self.num_steps = num_steps
+        self.step = step
+        self.latents = latents
+        self.scheduler = scheduler
+        self.seed = seed
+
+    @property
+    def remaining_steps(self):
+        return len(self.scheduler.timesteps) - self.step
+
+    def save(self, path):
+        torch.save({
+            "prompt": self.prompt,
+            "guidance_scale": self.guidance_scale,
+            "num_steps": self.num_steps,
+            "step": self.step,
+            "latents": self.latents.cpu(),
+            "scheduler": self.scheduler,
+            "seed": self.seed,
+        }, path)
+
+    @classmethod
+    def load(cls, path, device=None):
+        state = torch.load(path, map_location="cpu", weights_only=False)
+        if device is not None:
+            state["latents"] = state["latents"].to(device)
+        return cls(**state)
+
+
+def _encode(pipe, prompt, guidance_scale):
+    do_cfg = guidance_scale > 1.0
+    prompt_embeds, negative_embeds = pipe.encode_prompt(prompt, pipe.device, 1, do_cfg)
+    if do_cfg:
+        return torch.cat([negative_embeds, prompt_embeds])
+    return prompt_embeds
+
+
+def _denoise(pipe, scheduler, latents, embeds, guidance_scale, timesteps):
+    do_cfg = guidance_scale > 1.0
+    for t in timesteps:
+        model_input = torch.cat([latents] * 2) if do_cfg else latents
+        model_input = scheduler.scale_model_input(model_input, t)
+        noise_pred = pipe.unet(model_input, t, encoder_hidden_states=embeds).sample
+        if do_cfg:
+            uncond, text = noise_pred.chunk(2)
+            noise_pred = uncond + guidance_scale * (text - uncond)
+        latents = scheduler.step(noise_pred, t, latents).prev_sample
+    return latents
+
+
+def _decode(pipe, latents):
+    image = pipe.vae.decode(latents / pipe.vae.config.scaling_factor, return_dict=False)[0]
+    has_nsfw = None
+    if getattr(pipe, "safety_checker", None) is not None:
+        image, has_nsfw = pipe.run_safety_checker(image, pipe.device, latents.dtype)
+    do_denormalize = [not flagged for flagged in has_nsfw] if has_nsfw is not None else [True]
+    return pipe.image_processor.postprocess(image, output_type="pil", do_denormalize=do_denormalize)[0]
+
+
+@torch.no_grad()
+def generate_with_checkpoint(pipe, prompt, checkpoint_step, guidance_scale=7.5, num_steps=28,
+                             width=None, height=None, seed=None):
+    """
+    Generate like generate_background, and also capture a LatentCheckpoint
+    after checkpoint_step denoising steps. Returns (image, checkpoint).
+
+    Works with any StableDiffusionPipeline, including tiny test pipelines on
+    the CPU (e.g. "hf-internal-testing/tiny-stable-diffusion-torch").
+    """
+    height = height or pipe.unet.config.sample_size * pipe.vae_scale_factor
+    width = width or pipe.unet.config.sample_size * pipe.vae_scale_factor
+    embeds = _encode(pipe, prompt, guidance_scale)
+
+    scheduler = pipe.scheduler
+    scheduler.set_timesteps(num_steps, device=pipe.device)
+    timesteps = scheduler.timesteps
+    checkpoint_step = max(0, min(checkpoint_step, len(timesteps) - 1))
+
+    generator = torch.Generator(device=pipe.device).manual_seed(seed) if seed is not None else None
+    latents = pipe.prepare_latents(1, pipe.unet.config.in_channels, height, width,
+                                   embeds.dtype, pipe.device, generator)
+
+    latents = _denoise(pipe, scheduler, latents, embeds, guidance_scale, timesteps[:checkpoint_step])
+    checkpoint = LatentCheckpoint(prompt, guidance_scale, num_steps, checkpoint_step,
+                                  latents.clone(), copy.deepcopy(scheduler), seed)
+
+    latents = _denoise(pipe, scheduler, latents, embeds, guidance_scale, timesteps[checkpoint_step:])
+    return _decode(pipe, latents), checkpoint
+
+
+@torch.no_grad()
+def generate_variation(pipe, checkpoint, seed=None, strength=DEFAULT_VARIATION_STRENGTH,
+                       prompt=None, guidance_scale=None):
+    """
+    Finish a generation from a LatentCheckpoint, costing only its remaining
+    steps. seed injects fresh noise into the checkpointed latents (strength 0
+    keeps them, 1 replaces them); prompt and guidance_scale override the
+    original settings for the remaining steps. Returns a PIL Image.
+    """
+    prompt = checkpoint.prompt if prompt is None else prompt
+    guidance_scale = checkpoint.guidance_scale if guidance_scale is None else guidance_scale
+    embeds = _encode(pipe, prompt, guidance_scale)
+
+    latents = checkpoint.latents.to(pipe.device, embeds.dtype)
+    if seed is not None and strength > 0:
+        generator = torch.Generator(device=pipe.device).manual_seed(seed)
+        noise = torch.randn(latents.shape, generator=generator, device=pipe.device, dtype=latents.dtype)
+        # variance-preserving mix at the checkpoint's noise level
+        strength = min(1.0, strength)
+        latents = math.sqrt(1.0 - strength ** 2) * latents + strength * noise * latents.std()
+
+    scheduler = copy.deepcopy(checkpoint.scheduler)
+    timesteps = scheduler.timesteps[checkpoint.step:]
+    latents = _denoise(pipe, scheduler, latents, embeds, guidance_scale, timesteps)
+    return _decode(pipe, latents)
+
+
+def smoke_check(model="hf-internal-testing/tiny-stable-diffusion-torch", device="cpu", num_steps=10,
+                checkpoint_step=6, prompt="abstract poster background"):
+    """
+    Check branching against a real pipeline (the tiny test model by default,
+    seconds on the CPU): resuming an unchanged checkpoint must reproduce the
+    full run, and a resumed run must call the UNet only for the remaining
+    steps. Raises AssertionError on failure; returns the UNet call counts.
+    """
+    import os
+    import tempfile
+
+    import numpy as np
+
+    from backend.models import load_sd_model
+
+    pipe = load_sd_model(model, device=device, dtype=torch.float32)
+    calls = []
+    pipe.unet.register_forward_hook(lambda *_: calls.append(1))
+
+    full, checkpoint = generate_with_checkpoint(pipe, prompt, checkpoint_step, num_steps=num_steps, seed=0)
+    full_calls = len(calls)
+    assert full_calls == len(checkpoint.scheduler.timesteps), f"full run made {full_calls} UNet calls"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoint.pt")
+        checkpoint.save(path)
+        checkpoint = LatentCheckpoint.load(path, device=pipe.device)
+
+    calls.clear()
+    resumed = generate_variation(pipe, checkpoint)
+    resumed_calls = len(calls)
+    assert resumed_calls == checkpoint.remaining_steps, (
+        f"resumed run made {resumed_calls} UNet calls, expected {checkpoint.remaining_steps}"
+    )
+    diff = np.abs(np.asarray(full, dtype=np.int16) - np.asarray(resumed, dtype=np.int16)).max()
+    assert diff <= 1, f"unchanged resume differs from the full run by up to {diff}"
+
+    calls.clear()
+    varied = generate_variation(pipe, checkpoint, seed=1)
+    assert len(calls) == checkpoint.remaining_steps
+    assert np.asarray(varied).tobytes() != np.asarray(full).tobytes(), "seeded variation matched the full run"
+
+    return {"full": full_calls, "resumed": resumed_calls}
+
+
+if __name__ == "__main__":
+    # python -m backend.branching [model] [device]
+    import sys
+
+    counts = smoke_check(*sys.argv[1:3])
+    print(f"ok: full run {counts['full']} UNet calls, resumed run {counts['resumed']}")
@@ -0,0 +1,329 @@
+from collections import OrderedDict
+from PIL import Image
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from backend.layout import LayoutStats
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+CATALOG_DIRNAME = ".catalog"
+INDEX_FILENAME = "index.json"
+CATALOG_THUMBNAIL_WIDTH = 260
+DOMINANT_COLORS = 5
+# bump when analyze_background changes, so existing sidecars are rebuilt
+ANALYSIS_VERSION = 2
+LAYOUT_STATS_CACHE_SIZE = 32
+
+
+def _file_sha1(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dominant_colors(image, count=DOMINANT_COLORS):
+    quantized = image.quantize(colors=count, method=Image.Quantize.FASTOCTREE)
+    palette = quantized.getpalette()[:count * 3]
+    counts = sorted(quantized.getcolors(), reverse=True)
+    total = sum(n for n, _ in counts) or 1
+    return [
+        {"rgb": palette[idx * 3:idx * 3 + 3], "share": round(n / total, 3)}
+        for n, idx in counts
+    ]
+
+
+def analyze_background(path):
+    """
+    Decode a background once and compute everything the UI and renderer
+    need later: dimensions, a display thumbnail, the downsampled layout
+    channels (luminance, relative luminance, texture, saliency) and a
+    dominant-colour summary.
+    """
+    with Image.open(path) as img:
+        image = img.convert("RGB")
+    width, height = image.size
+
+    # full decode (no JPEG draft) so the stats match what overlay_text computes
+    stats = LayoutStats(image)
+
+    thumb_w = min(CATALOG_THUMBNAIL_WIDTH, image.width)
+    thumb_h = max(1, round(image.height * thumb_w / image.width))
+    thumbnail = image.resize((thumb_w, thumb_h), Image.BILINEAR, reducing_gap=2.0)
+
+    texture_profile = stats.channels["texture"].mean(axis=1)
+
+    return {
+        "width": width,
+        "height": height,
+        "thumbnail": thumbnail,
+        "channels": stats.channels,
+        "texture_profile": texture_profile,
+        "dominant_colors": _dominant_colors(thumbnail),
+    }
+
+
+class BackgroundCatalog:
+    """
+    Index of a background image directory with precomputed sidecars.
+
+    Each image gets a JPEG thumbnail and an .npz sidecar in
+    <image_dir>/.catalog. Sidecars are named by content hash, so a renamed
+    file reuses its analysis. The sidecar holds the downsampled layout
+    channels and the per-row texture profile. index.json records
+    dimensions, dominant colours and the mtime/size used for change
+    detection. A file whose mtime changed but whose hash did not is not
+    re-analyzed.
+
+    With background=True, refresh() only scans the directory; new and
+    changed files are hashed and analyzed on a worker thread and appear in
+    names() as each one finishes (see pending).
+    """
+
+    def __init__(self, image_dir, cache_dir=None, refresh_interval=5.0, background=False,
+                 max_layout_stats=LAYOUT_STATS_CACHE_SIZE):
+        self.image_dir = image_dir
+        self.cache_dir = cache_dir or os.path.join(image_dir, CATALOG_DIRNAME)
+        self.refresh_interval = refresh_interval
+        self.max_layout_stats = max_layout_stats
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = OrderedDict()
+        self._stacks = {}
+        self._pending = set()
+        # background analysis failures by file name; retried once the file changes
+        self.errors = {}
+        self._last_refresh = 0.0
+        self._load_index()
+
+        self._queue = None
+        if background:
+            self._queue = queue.Queue()
+            threading.Thread(target=self._work, daemon=True).start()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILENAME)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._entries = {}
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self._index_path)
+
+    def _analyze(self, path, sha1):
+        result = analyze_background(path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        sidecar = f"{sha1[:16]}.npz"
+        thumb = f"{sha1[:16]}.jpg"
+        channels = result["channels"]
+        np.savez_compressed(
+            os.path.join(self.cache_dir, sidecar),
+            lum=channels["lum"].astype(np.uint8),
+            rel_lum=channels["rel_lum"].astype(np.float16),
+            texture=channels["texture"].astype(np.float16),
+            saliency=channels["saliency"].astype(np.float16),
+            texture_profile=result["texture_profile"].astype(np.float16),
+        )
+        result["thumbnail"].save(os.path.join(self.cache_dir, thumb), format="JPEG", quality=85)
+
+        return {
+            "width": result["width"],
+            "height": result["height"],
+            "dominant_colors": result["dominant_colors"],
+            "sidecar": sidecar,
+            "thumbnail": thumb,
+            "analysis_version": ANALYSIS_VERSION,
+        }
+
+    def refresh(self, force=False):
+        """
+        Pick up added, changed and removed images. Throttled to one
+        directory scan per refresh_interval unless force is set. Returns
+        whether anything changed (or, in background mode, was queued).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return False
+            self._last_refresh = now
+
+            seen, todo = set(), []
+            if os.path.isdir(self.image_dir):
+                for entry in os.scandir(self.image_dir):
+                    if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    seen.add(entry.name)
+                    st = entry.stat()
+                    current = self._entries.get(entry.name)
+                    if (current and current["mtime"] == st.st_mtime and current["size"] == st.st_size
+                            and current.get("analysis_version") == ANALYSIS_VERSION):
+                        continue
+                    failed = self.errors.get(entry.name)
+                    if failed and failed["mtime"] == st.st_mtime and failed["size"] == st.st_size:
+                        continue
+                    if entry.name not in self._pending:
+                        todo.append((entry.name, entry.path, st))
+
+            removed = set(self._entries) - seen
+            for name in set(self.errors) - seen:
+                del self.errors[name]
+            for name in removed:
+                del self._entries[name]
+                self._stats.pop(name, None)
+            if removed:
+                self._save_index()
+                self._stacks.clear()
+
+            if self._queue is not None:
+                self._pending.update(name for name, _, _ in todo)
+
+        if self._queue is not None:
+            for item in todo:
+                self._queue.put(item)
+            return bool(removed or todo)
+
+        changed = [self._index_file(*item) for item in todo]
+        return bool(removed) or any(changed)
+
+    @property
+    def pending(self):
+        """
+        Number of files queued for background analysis.
+        """
+        return len(self._pending)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._index_file(*item)
+            except Exception as e:
+                # e.g. a decompression bomb or malformed file; skip it and keep the worker alive
+                name, _, st = item
+                self.errors[name] = {"mtime": st.st_mtime, "size": st.st_size, "error": f"{type(e).__name__}: {e}"}
+            else:
+                self.errors.pop(item[0], None)
+            finally:
+                with self._lock:
+                    self._pending.discard(item[0])
+
+    def _index_file(self, name, path, st):
+        # hash and (unless a sidecar with the same content exists) analyze one file, without holding the lock
+        try:
+            sha1 = _file_sha1(path)
+        except OSError:
+            return False
+
+        with self._lock:
+            reuse = next(
+                (e for e in self._entries.values()
+                 if e["sha1"] == sha1 and e.get("analysis_version") == ANALYSIS_VERSION),
+                None,
+            )
+        if reuse is not None and os.path.exists(os.path.join(self.cache_dir, reuse["sidecar"])):
+            record = dict(reuse)
+        else:
+            try:
+                record = self._analyze(path, sha1)
+            except OSError:
+                # unreadable or half-written image; try again on the next scan
+                return False
+        record.update({"mtime": st.st_mtime, "size": st.st_size, "sha1": sha1})
+
+        with self._lock:
+            self._entries[name] = record
+            self._stats.pop(name, None)
+            self._stacks.clear()
+            self._save_index()
+        return True
+
+    def names(self):
+        with self._lock:
+            return sorted(self._entries)
+
+    def info(self, name):
+        return self._entries[name]
+
+    def thumbnail_path(self, name):
+        return os.path.join(self.cache_dir, self._entries[name]["thumbnail"])
+
+    def thumbnail(self, name):
+        with open(self.thumbnail_path(name), "rb") as f:
+            return f.read()
+
+    def path(self, name):
+        return os.path.join(self.image_dir, name)
+
+    def load_sidecar(self, name, keys=None):
+        """
+        Arrays from a background's sidecar; with keys, only those arrays are
+        decompressed.
+        """
+        entry = self._entries[name]
+        with np.load(os.path.join(self.cache_dir, entry["sidecar"])) as data:
+            return {key: data[key] for key in (keys or data.files)}
+
+    def stacked_channels(self, keys, size):
+        """
+        (names, {key: (N, h, w) float32 array}) for every catalogued
+        background, with the given sidecar channels resampled to size
+        (w, h). Built once and rebuilt only after refresh() finds changes.
+        """
+        cache_key = (tuple(keys), tuple(size))
+        with self._lock:
+            cached = self._stacks.get(cache_key)
+            if cached is not None:
+                return cached
+
+            names = sorted(self._entries)
+            stacks = {key: np.zeros((len(names), size[1], size[0]), dtype=np.float32) for key in keys}
+            for i, name in enumerate(names):
+                sidecar = self.load_sidecar(name, keys)
+                for key in keys:
+                    channel = Image.fromarray(sidecar[key].astype(np.float32))
+                    stacks[key][i] = np.asarray(channel.resize(tuple(size), Image.BILINEAR))
+            cached = (names, stacks)
+            self._stacks[cache_key] = cached
+            return cached
+
+    def layout_stats(self, name):
+        """
+        LayoutStats for a catalogued background, rebuilt from its sidecar
+        instead of decoding the image. The most recently used ones are kept
+        (up to max_layout_stats).
+        """
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is not None:
+                self._stats.move_to_end(name)
+                return stats
+            entry = self._entries[name]
+
+        channels = self.load_sidecar(name, ("lum", "rel_lum", "texture", "saliency"))
+        stats = LayoutStats.from_channels(entry["width"], entry["height"], channels)
+
+        with self._lock:
+            self._stats[name] = stats
+            self._stats.move_to_end(name)
+            while len(self._stats) > self.max_layout_stats:
+                self._stats.popitem(last=False)
+        return stats
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+# WCAG 2.x thresholds: 4.5 for normal text, 3.0 for large text
+MIN_CONTRAST_RATIO = 4.5
+LARGE_TEXT_CONTRAST_RATIO = 3.0
+
+TEXT_LUMINANCE = {"white": 1.0, "black": 0.0}
+
+
+def relative_luminance(rgb):
+    """
+    WCAG relative luminance of an (..., 3) uint8 RGB array, in 0..1.
+    """
+    c = np.asarray(rgb, dtype=np.float32) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def contrast_ratio(l1, l2):
+    lighter = np.maximum(l1, l2)
+    darker = np.minimum(l1, l2)
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+def line_boxes(draw, positions, font):
+    """
+    Exact glyph bounding boxes (x0, y0, x1, y1) of positioned lines.
+    """
+    return [draw.textbbox((x, y), line, font=font) for line, x, y in positions]
+
+
+def choose_line_styles(stats, boxes, large_text=False):
+    """
+    Pick a text colour and contrast effect for every line at once.
+
+    boxes is a sequence of glyph bounding boxes in full-resolution pixels.
+    Luminance statistics under all boxes come from one batched query on the
+    precomputed integral images. The colour with the better WCAG ratio
+    against the mean background wins. If the ratio against a background
+    one standard deviation closer to the text colour falls below the
+    threshold, the line also gets a stroke (dark text) or shadow (light text).
+    """
+    if len(boxes) == 0:
+        return []
+
+    b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x0, y0, x1, y1 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+
+    mean_rel = stats.box_means("rel_lum", x0, y0, x1, y1)
+    mean_rel_sq = stats.box_means("rel_lum_sq", x0, y0, x1, y1)
+    std_rel = np.sqrt(np.maximum(mean_rel_sq - mean_rel ** 2, 0.0))
+    brightness = stats.box_means("lum", x0, y0, x1, y1)
+
+    white_ratio = contrast_ratio(TEXT_LUMINANCE["white"], mean_rel)
+    black_ratio = contrast_ratio(TEXT_LUMINANCE["black"], mean_rel)
+    use_white = white_ratio >= black_ratio
+
+    # worst case: the brighter (or darker) parts of a busy background
+    worst_bg = np.where(use_white, np.minimum(mean_rel + std_rel, 1.0), np.maximum(mean_rel - std_rel, 0.0))
+    worst_ratio = np.where(
+        use_white,
+        contrast_ratio(TEXT_LUMINANCE["white"], worst_bg),
+        contrast_ratio(TEXT_LUMINANCE["black"], worst_bg),
+    )
+
+    threshold = LARGE_TEXT_CONTRAST_RATIO if large_text else MIN_CONTRAST_RATIO
+    needs_effect = worst_ratio < threshold
+
+    styles = []
+    for i in range(len(b)):
+        color = "white" if use_white[i] else "black"
+        if needs_effect[i]:
+            effect = "shadow" if use_white[i] else "stroke"
+        else:
+            effect = "none"
+        styles.append({
+            "text_color": color,
+            "effect": effect,
+            "effect_color": "black" if use_white[i] else "white",
+            "contrast_ratio": round(float(np.where(use_white[i], white_ratio[i], black_ratio[i])), 2),
+            "brightness": round(float(brightness[i]), 2),
+        })
+    return styles
@@ -0,0 +1,123 @@
+import numpy as np
+
+from backend.font_metrics import greedy_line_counts, load_metrics
+from backend.postprocessing import (
+    MAX_TITLE_SCALE, MIN_TITLE_SCALE, MAX_SUBTITLE_SCALE, MIN_SUBTITLE_SCALE, remove_emoji
+)
+
+
+SIZE_STEPS = 48
+
+MAX_TITLE_LINES = 3
+MAX_SUB_LINES = 2
+MAX_TITLE_HEIGHT_RATIO = 0.45
+MAX_SUB_HEIGHT_RATIO = 0.14
+SAFE_MARGIN_RATIO = 0.10
+MAX_HEADROOM = 2.0
+
+
+def _fit(metrics, text, sizes, max_width, max_lines, max_height, spacing_ratio):
+    """
+    Largest size in the ascending sizes array whose greedy wrap fits the
+    line and height limits. Returns (size, lines, overflow).
+    """
+    words = text.split()
+    if not words:
+        return int(sizes[-1]), 0, False
+
+    word_widths = metrics.word_widths(words)
+    lines = greedy_line_counts(word_widths, metrics.text_width(" "), max_width / sizes)
+
+    heights = sizes * (lines * metrics.line_height + (lines - 1) * spacing_ratio)
+    fits = (lines <= max_lines) & (heights <= max_height) & (word_widths.max() * sizes <= max_width)
+
+    if fits.any():
+        best = np.flatnonzero(fits)[-1]
+        return int(sizes[best]), int(lines[best]), False
+    # nothing fits; report the smallest size, which is what overlay_text ends up truncating
+    return int(sizes[0]), int(min(lines[0], max_lines)), True
+
+
+def recommend_fonts(fonts, title, subtitle, canvas_size=(1080, 1080), variant=None):
+    """
+    Rank fonts for a title/subtitle pair on a canvas without rendering,
+    using each font's memory-mapped metrics table.
+
+    fonts maps display names to TTF paths (e.g. FONT_OPTIONS). For each font
+    this computes the largest title and subtitle size that fit the same
+    margins and line limits overlay_text uses, the resulting line counts,
+    overflow, and a legibility estimate (achieved size relative to the
+    variant's preferred size, weighted by x-height). Fonts that reach the
+    preferred size are told apart by headroom: how much larger the title
+    could be set before it stops fitting. Returns dicts sorted best first,
+    ties by name.
+    """
+    variant = variant or {}
+    w, h = canvas_size
+
+    base_dimension = min(w, h)
+    if w / h > 1.5:
+        base_dimension = int(base_dimension * 1.15)
+
+    max_width = w - 2 * int(w * SAFE_MARGIN_RATIO)
+
+    title_text, _ = remove_emoji(title or "")
+    sub_text, _ = remove_emoji(subtitle or "")
+
+    preferred_title = base_dimension * max(MIN_TITLE_SCALE, min(MAX_TITLE_SCALE, variant.get("title_scale", 0.10)))
+    preferred_sub = base_dimension * max(MIN_SUBTITLE_SCALE, min(MAX_SUBTITLE_SCALE, variant.get("subtitle_scale", 0.045)))
+
+    title_sizes = np.linspace(base_dimension * MIN_TITLE_SCALE, preferred_title, SIZE_STEPS).astype(np.intp)
+    sub_sizes = np.linspace(base_dimension * MIN_SUBTITLE_SCALE, preferred_sub, SIZE_STEPS).astype(np.intp)
+    title_sizes = np.unique(np.maximum(title_sizes, 1))
+    # sizes past the preferred one, only used to measure headroom
+    headroom_sizes = np.unique(np.maximum(
+        np.linspace(preferred_title, preferred_title * MAX_HEADROOM, SIZE_STEPS).astype(np.intp), 1
+    ))
+    sub_sizes = np.unique(np.maximum(sub_sizes, 1))
+
+    results = []
+    for name, path in fonts.items():
+        try:
+            metrics = load_metrics(path)
+        except OSError:
+            continue
+
+        title_size, title_lines, title_overflow = _fit(
+            metrics, title_text, title_sizes, max_width, MAX_TITLE_LINES, h * MAX_TITLE_HEIGHT_RATIO, 0.2
+        )
+        sub_size, sub_lines, sub_overflow = _fit(
+            metrics, sub_text, sub_sizes, max_width, MAX_SUB_LINES, h * MAX_SUB_HEIGHT_RATIO, 0.3
+        )
+
+        headroom = 1.0
+        if not title_overflow and title_text.strip():
+            largest, _, too_big = _fit(
+                metrics, title_text, headroom_sizes, max_width, MAX_TITLE_LINES, h * MAX_TITLE_HEIGHT_RATIO, 0.2
+            )
+            headroom = 1.0 if too_big else largest / preferred_title
+
+        # x-height relative to a typical 0.5 em
+        x_factor = metrics.x_height / 0.5
+        title_legibility = (title_size / preferred_title) * x_factor
+        sub_legibility = (sub_size / preferred_sub) * x_factor if sub_text.strip() else x_factor
+
+        score = 0.6 * title_legibility + 0.25 * sub_legibility + 0.15 * (headroom - 1.0)
+        score -= 0.5 * title_overflow + 0.25 * sub_overflow
+
+        results.append({
+            "name": name,
+            "path": path,
+            "title_size": title_size,
+            "title_lines": title_lines,
+            "title_overflow": title_overflow,
+            "subtitle_size": sub_size,
+            "subtitle_lines": sub_lines,
+            "subtitle_overflow": sub_overflow,
+            "legibility": round(float(title_legibility), 3),
+            "headroom": round(float(headroom), 3),
+            "score": round(float(score), 3),
+        })
+
+    results.sort(key=lambda r: (-r["score"], r["name"]))
+    return results
@@ -0,0 +1,179 @@
+from functools import lru_cache
+from PIL import ImageFont
+import os
+import struct
+import sys
+
+import numpy as np
+
+
+METRICS_VERSION = 1
+METRICS_MAGIC = b"FMT1"
+METRICS_DIRNAME = ".metrics"
+REFERENCE_SIZE = 1000
+
+# magic, version, reference size, first codepoint, codepoint count,
+# kerning pair count, ascent, descent, x-height (all at REFERENCE_SIZE)
+_HEADER = struct.Struct("<4sIIIIIfff")
+_HEADER_SIZE = 64
+
+# codepoints measured when building a table: Basic Latin, Latin-1 and
+# Latin Extended-A, then general punctuation and a few common symbols
+MEASURED_RANGES = [(0x20, 0x7F), (0xA0, 0x180), (0x2010, 0x2045), (0x20AC, 0x20AD), (0x2122, 0x2123)]
+KERNING_RANGE = (0x20, 0x7F)
+
+_KERN_BASE = 0x110000
+
+
+def metrics_path(font_path):
+    font_dir, name = os.path.split(font_path)
+    return os.path.join(font_dir, METRICS_DIRNAME, os.path.splitext(name)[0] + ".fmt")
+
+
+def build_metrics(font_path, out_path=None):
+    """
+    Measure a TTF once with FreeType and write its metrics table.
+
+    The table holds dense per-codepoint advances over MEASURED_RANGES
+    (NaN where nothing was measured) and every non-zero kerning pair within
+    KERNING_RANGE, all at REFERENCE_SIZE. Kerning is whatever Pillow's
+    layout engine applies: the pair advance minus the two single advances.
+    """
+    out_path = out_path or metrics_path(font_path)
+    font = ImageFont.truetype(font_path, size=REFERENCE_SIZE)
+
+    first_cp = MEASURED_RANGES[0][0]
+    last_cp = MEASURED_RANGES[-1][1]
+    advances = np.full(last_cp - first_cp, np.nan, dtype=np.float32)
+    for lo, hi in MEASURED_RANGES:
+        for cp in range(lo, hi):
+            advances[cp - first_cp] = font.getlength(chr(cp))
+
+    kern_keys, kern_values = [], []
+    lo, hi = KERNING_RANGE
+    for left in range(lo, hi):
+        for right in range(lo, hi):
+            kern = font.getlength(chr(left) + chr(right)) - advances[left - first_cp] - advances[right - first_cp]
+            if kern:
+                kern_keys.append(left * _KERN_BASE + right)
+                kern_values.append(kern)
+
+    ascent, descent = font.getmetrics()
+    x_box = font.getbbox("x")
+
+    header = _HEADER.pack(
+        METRICS_MAGIC, METRICS_VERSION, REFERENCE_SIZE, first_cp, len(advances),
+        len(kern_keys), ascent, descent, x_box[3] - x_box[1],
+    ).ljust(_HEADER_SIZE, b"\0")
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(advances.tobytes())
+        f.write(np.asarray(kern_keys, dtype=np.int64).tobytes())
+        f.write(np.asarray(kern_values, dtype=np.float32).tobytes())
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class FontMetrics:
+    """
+    Memory-mapped metrics table for one font. Widths at any size are
+    computed arithmetically from the reference advances and kerning pairs,
+    without a FreeType face.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(_HEADER_SIZE)
+        (magic, version, ref_size, first_cp, n_cp, n_kern,
+         ascent, descent, x_height) = _HEADER.unpack_from(header)
+        if magic != METRICS_MAGIC or version != METRICS_VERSION:
+            raise ValueError(f"not a font metrics table: {path}")
+
+        self.reference_size = ref_size
+        self.first_cp = first_cp
+        self.line_height = (ascent + descent) / ref_size
+        self.x_height = x_height / ref_size
+
+        self.advances = np.memmap(path, dtype=np.float32, mode="r", offset=_HEADER_SIZE, shape=(n_cp,))
+        offset = _HEADER_SIZE + 4 * n_cp
+        if n_kern:
+            self.kern_keys = np.memmap(path, dtype=np.int64, mode="r", offset=offset, shape=(n_kern,))
+            self.kern_values = np.memmap(path, dtype=np.float32, mode="r", offset=offset + 8 * n_kern, shape=(n_kern,))
+        else:
+            self.kern_keys = np.zeros(0, dtype=np.int64)
+            self.kern_values = np.zeros(0, dtype=np.float32)
+
+        known = self.advances[~np.isnan(self.advances)]
+        # stand-in for codepoints outside the table (emoji are stripped earlier)
+        self.fallback_advance = float(np.median(known)) if known.size else 0.5 * ref_size
+
+    def _codepoints(self, text):
+        return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+
+    def _advances(self, cps):
+        idx = cps - self.first_cp
+        inside = (idx >= 0) & (idx < len(self.advances))
+        adv = np.full(len(cps), self.fallback_advance, dtype=np.float64)
+        adv[inside] = self.advances[idx[inside]]
+        return np.where(np.isnan(adv), self.fallback_advance, adv)
+
+    def _kerning(self, cps):
+        if len(cps) < 2 or not len(self.kern_keys):
+            return 0.0
+        keys = cps[:-1] * _KERN_BASE + cps[1:]
+        pos = np.minimum(np.searchsorted(self.kern_keys, keys), len(self.kern_keys) - 1)
+        hit = self.kern_keys[pos] == keys
+        return float(self.kern_values[pos][hit].sum())
+
+    def text_width(self, text, size=None):
+        """
+        Advance width of text at size (default: at size 1).
+        """
+        cps = self._codepoints(text)
+        width = (self._advances(cps).sum() + self._kerning(cps)) / self.reference_size
+        return width * size if size is not None else width
+
+    def word_widths(self, words):
+        return np.array([self.text_width(word) for word in words], dtype=np.float64)
+
+
+@lru_cache(maxsize=64)
+def load_metrics(font_path):
+    """
+    FontMetrics for a TTF, building its table on first use or when the
+    font file is newer than the table.
+    """
+    path = metrics_path(font_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(font_path):
+        build_metrics(font_path, path)
+    return FontMetrics(path)
+
+
+def greedy_line_counts(word_widths, space, max_widths):
+    """
+    Number of lines a greedy word wrap produces for each limit in
+    max_widths, evaluated for all limits at once. word_widths, space and
+    max_widths share one unit (e.g. size 1).
+    """
+    max_widths = np.asarray(max_widths, dtype=np.float64)
+    if len(word_widths) == 0:
+        return np.zeros(len(max_widths), dtype=np.intp)
+
+    current = np.full(len(max_widths), word_widths[0], dtype=np.float64)
+    lines = np.ones(len(max_widths), dtype=np.intp)
+    for ww in word_widths[1:]:
+        fits = current + space + ww <= max_widths
+        current = np.where(fits, current + space + ww, ww)
+        lines += ~fits
+    return lines
+
+
+if __name__ == "__main__":
+    # python -m backend.font_metrics [font_dir]
+    font_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join("assets", "fonts")
+    for name in sorted(os.listdir(font_dir)):
+        if name.lower().endswith(".ttf"):
+            print(build_metrics(os.path.join(font_dir, name)))
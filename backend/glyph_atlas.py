@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+import threading
+
+import numpy as np
+
+
+MAX_ATLAS_GLYPHS = 8192
+
+
+@lru_cache(maxsize=128)
+def cached_font(font_path, size):
+    return ImageFont.truetype(font_path, size=size)
+
+
+class GlyphAtlas:
+    """
+    Cache of rasterized glyph coverage masks keyed by
+    (font path, size, glyph, stroke width).
+
+    Lines are composed by blitting cached masks along the pen position,
+    with kerning taken as the difference between the pair's advance and
+    the two single advances. A recurring title is rasterized by FreeType
+    once per glyph and size, however many variants, platforms and shrink
+    attempts render it.
+    """
+
+    def __init__(self, max_glyphs=MAX_ATLAS_GLYPHS):
+        self.max_glyphs = max_glyphs
+        self._glyphs = OrderedDict()
+        self._advances = {}
+        self._kerning = {}
+        self._lock = threading.Lock()
+
+    def glyph(self, font, char, stroke_width=0):
+        """
+        Return (mask, x_offset, y_offset) for one glyph, where the offsets
+        place the uint8 mask relative to the pen position (left/ascender).
+        """
+        key = (font.path, font.size, char, stroke_width)
+        with self._lock:
+            cached = self._glyphs.get(key)
+            if cached is not None:
+                self._glyphs.move_to_end(key)
+                return cached
+
+        x0, y0, x1, y1 = font.getbbox(char, stroke_width=stroke_width)
+        if x1 <= x0 or y1 <= y0:
+            entry = (np.zeros((0, 0), dtype=np.uint8), 0, 0)
+        else:
+            mask = Image.new("L", (x1 - x0, y1 - y0), 0)
+            ImageDraw.Draw(mask).text((-x0, -y0), char, font=font, fill=255, stroke_width=stroke_width)
+            entry = (np.asarray(mask), x0, y0)
+
+        with self._lock:
+            self._glyphs[key] = entry
+            while len(self._glyphs) > self.max_glyphs:
+                self._glyphs.popitem(last=False)
+        return entry
+
+    def advance(self, font, char):
+        key = (font.path, font.size, char)
+        adv = self._advances.get(key)
+        if adv is None:
+            adv = self._advances[key] = font.getlength(char)
+        return adv
+
+    def kerning(self, font, left, right):
+        key = (font.path, font.size, left, right)
+        kern = self._kerning.get(key)
+        if kern is None:
+            kern = font.getlength(left + right) - self.advance(font, left) - self.advance(font, right)
+            self._kerning[key] = kern
+        return kern
+
+    def blit_line(self, target, text, font, x, y, stroke_width=0):
+        """
+        Draw a line of text into a uint8 coverage array in place, with the
+        pen starting at (x, y) using the same anchor as ImageDraw.text.
+        """
+        height, width = target.shape
+        pen = float(x)
+        prev = None
+
+        for char in text:
+            if prev is not None:
+                pen += self.kerning(font, prev, char)
+
+            mask, gx, gy = self.glyph(font, char, stroke_width)
+            if mask.size:
+                left = int(round(pen)) + gx
+                top = int(y) + gy
+                # clip to target
+                sx0, sy0 = max(0, -left), max(0, -top)
+                dx0, dy0 = max(0, left), max(0, top)
+                dx1 = min(width, left + mask.shape[1])
+                dy1 = min(height, top + mask.shape[0])
+                if dx1 > dx0 and dy1 > dy0:
+                    region = target[dy0:dy1, dx0:dx1]
+                    np.maximum(
+                        region,
+                        mask[sy0:sy0 + (dy1 - dy0), sx0:sx0 + (dx1 - dx0)],
+                        out=region,
+                    )
+
+            pen += self.advance(font, char)
+            prev = char
+
+
+GLYPH_ATLAS = GlyphAtlas()
@@ -0,0 +1,266 @@
+from collections import OrderedDict
+from PIL import Image
+import io
+import numpy as np
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from backend.postprocessing import make_thumbnails, THUMBNAIL_WIDTHS
+
+
+DEFAULT_MAX_MEMORY_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENCODED_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_MAX_AGE = 6 * 3600
+
+
+def _image_nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class ImageStore:
+    """
+    Process-wide image store shared by all Streamlit sessions.
+
+    Sessions keep only the string handle returned by put(). Images are kept
+    in memory up to max_memory_bytes; the least recently used ones beyond
+    that are spilled to an uncompressed .npy file as they are evicted (each
+    at most once) and re-read from disk on get(). Images that fit in memory
+    never touch the disk.
+
+    Sessions that end never release their handles, so handles are capped
+    too: once the spill files exceed max_disk_bytes, or a handle has not
+    been used for max_age seconds, the least recently used handles are
+    released entirely (image, file, thumbnails and encodings) and no longer
+    resolve.
+
+    Display thumbnails are encoded once on put and kept in memory; they are
+    small and are what the UI sends to the browser on every rerun. Full-size
+    encodings for downloads are kept in a separate LRU capped at
+    max_encoded_bytes.
+    """
+
+    def __init__(self, cache_dir=None, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES,
+                 max_encoded_bytes=DEFAULT_MAX_ENCODED_BYTES, max_disk_bytes=DEFAULT_MAX_DISK_BYTES,
+                 max_age=DEFAULT_MAX_AGE):
+        if cache_dir is None:
+            # handles die with the process, so each process gets a fresh directory
+            cache_dir = tempfile.mkdtemp(prefix="design_assistant_images_")
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_encoded_bytes = max_encoded_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._thumbnails = {}
+        self._encoded = OrderedDict()
+        self._encoded_bytes = 0
+        # live handles, least recently used first: handle -> (spill file bytes or 0, last use)
+        self._handles = OrderedDict()
+        self._disk_bytes = 0
+        # evicted images whose spill file is still being written
+        self._spilling = {}
+
+    def _path(self, handle):
+        return os.path.join(self.cache_dir, f"{handle}.npy")
+
+    def _remember(self, handle, image):
+        # caller holds the lock; returns evicted images that still need a spill file
+        if handle in self._memory:
+            self._memory.move_to_end(handle)
+            return []
+        self._memory[handle] = image
+        self._memory_bytes += _image_nbytes(image)
+        return self._evict()
+
+    def _evict(self):
+        # always keep the most recent image, even if it alone exceeds the cap
+        spill = []
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            handle, old = self._memory.popitem(last=False)
+            self._memory_bytes -= _image_nbytes(old)
+            entry = self._handles.get(handle)
+            if entry is not None and not entry[0]:
+                self._spilling[handle] = old
+                spill.append((handle, old))
+        return spill
+
+    def _spill(self, spill):
+        # write evicted images outside the lock; get() serves them from _spilling meanwhile
+        for handle, image in spill:
+            path = self._path(handle)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(image))
+            os.replace(tmp_path, path)
+            nbytes = os.path.getsize(path)
+
+            with self._lock:
+                self._spilling.pop(handle, None)
+                entry = self._handles.get(handle)
+                if entry is None:
+                    # released while it was being written
+                    os.remove(path)
+                    continue
+                self._handles[handle] = (nbytes, entry[1])
+                self._disk_bytes += nbytes
+                expired = self._expire()
+            self.release(*expired)
+
+    def _touch(self, handle):
+        # caller holds the lock
+        entry = self._handles.get(handle)
+        if entry is not None:
+            self._handles[handle] = (entry[0], time.monotonic())
+            self._handles.move_to_end(handle)
+
+    def _expire(self):
+        # caller holds the lock; always keeps the most recent handle
+        cutoff = time.monotonic() - self.max_age if self.max_age else None
+        expired, disk_bytes = [], self._disk_bytes
+        for handle, (nbytes, last_used) in self._handles.items():
+            if len(self._handles) - len(expired) <= 1:
+                break
+            over_size = self.max_disk_bytes is not None and disk_bytes > self.max_disk_bytes
+            if not over_size and (cutoff is None or last_used >= cutoff):
+                break
+            disk_bytes -= nbytes
+            expired.append(handle)
+        return expired
+
+    def put(self, image, thumbnail_widths=THUMBNAIL_WIDTHS):
+        """
+        Store a PIL image and return its handle.
+        """
+        if image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("RGB")
+        else:
+            image = image.copy()
+
+        handle = uuid.uuid4().hex
+        thumbs = make_thumbnails(image, thumbnail_widths) if thumbnail_widths else {}
+
+        with self._lock:
+            self._thumbnails[handle] = thumbs
+            self._handles[handle] = (0, time.monotonic())
+            spill = self._remember(handle, image)
+            expired = self._expire()
+        self.release(*expired)
+        self._spill(spill)
+        return handle
+
+    def get(self, handle):
+        """
+        Return the image for a handle, rehydrating it from disk if it was
+        evicted. Raises KeyError for unknown or released handles.
+        """
+        with self._lock:
+            self._touch(handle)
+            image = self._memory.get(handle)
+            if image is not None:
+                self._memory.move_to_end(handle)
+                return image
+            image = self._spilling.get(handle)
+            if image is not None:
+                return image
+            if handle not in self._handles:
+                raise KeyError(handle)
+
+        try:
+            arr = np.load(self._path(handle))
+        except FileNotFoundError:
+            raise KeyError(handle)
+        image = Image.fromarray(arr)
+
+        spill = []
+        with self._lock:
+            if handle in self._handles:
+                spill = self._remember(handle, image)
+        self._spill(spill)
+        return image
+
+    def thumbnail(self, handle, width):
+        """
+        Return encoded thumbnail bytes for a handle, encoding (and caching)
+        the requested width on first use.
+        """
+        with self._lock:
+            self._touch(handle)
+            thumbs = self._thumbnails.get(handle)
+            if thumbs is not None and width in thumbs:
+                return thumbs[width]
+
+        encoded = make_thumbnails(self.get(handle), (width,))[width]
+        with self._lock:
+            if handle in self._handles:
+                self._thumbnails.setdefault(handle, {})[width] = encoded
+        return encoded
+
+    def encoded(self, handle, fmt="PNG"):
+        """
+        Return the full-size image for a handle encoded as fmt, encoding it
+        on first use and caching the bytes (least recently used evicted).
+        """
+        key = (handle, fmt)
+        with self._lock:
+            self._touch(handle)
+            data = self._encoded.get(key)
+            if data is not None:
+                self._encoded.move_to_end(key)
+                return data
+
+        buf = io.BytesIO()
+        self.get(handle).save(buf, format=fmt)
+        data = buf.getvalue()
+
+        with self._lock:
+            # skip caching if the handle was released meanwhile
+            if key not in self._encoded and handle in self._handles:
+                self._encoded[key] = data
+                self._encoded_bytes += len(data)
+            while self._encoded_bytes > self.max_encoded_bytes and len(self._encoded) > 1:
+                _, old = self._encoded.popitem(last=False)
+                self._encoded_bytes -= len(old)
+        return data
+
+    def __contains__(self, handle):
+        with self._lock:
+            return handle in self._handles
+
+    def release(self, *handles):
+        """
+        Drop images that no session refers to any more.
+        """
+        with self._lock:
+            for handle in handles:
+                if handle is None:
+                    continue
+                image = self._memory.pop(handle, None)
+                if image is not None:
+                    self._memory_bytes -= _image_nbytes(image)
+                self._thumbnails.pop(handle, None)
+                self._spilling.pop(handle, None)
+                entry = self._handles.pop(handle, None)
+                if entry is not None:
+                    self._disk_bytes -= entry[0]
+                for key in [key for key in self._encoded if key[0] == handle]:
+                    self._encoded_bytes -= len(self._encoded.pop(key))
+                try:
+                    os.remove(self._path(handle))
+                except FileNotFoundError:
+                    pass
+
+    @property
+    def memory_bytes(self):
+        return self._memory_bytes
+
+    @property
+    def disk_bytes(self):
+        return self._disk_bytes
@@ -0,0 +1,246 @@
+from PIL import Image
+import copy
+import numpy as np
+
+from backend.contrast import relative_luminance
+from backend.saliency import saliency_map
+
+
+ANALYSIS_MAX_SIDE = 256
+
+# vertical zones (fractions of image height) the title may start in, per platform
+TITLE_ZONES = {
+    "YouTube": (0.18, 0.65),
+    "LinkedIn": (0.10, 0.60),
+    None: (0.08, 0.60),
+}
+
+SUBTITLE_TARGET = 0.80
+SUBTITLE_BOTTOM = 0.94
+
+ALIGNMENTS = ("center", "left", "right")
+
+# score weights, lower total score is better
+TEXTURE_WEIGHT = 1.0
+SALIENCY_WEIGHT = 1.5
+CONTRAST_WEIGHT = 0.5
+POSITION_WEIGHT = 2.0
+SUBTITLE_WEIGHT = 0.6
+OFF_CENTER_PENALTY = 0.15
+
+
+def integral_image(arr):
+    """
+    Summed-area table with a leading row and column of zeros, so the sum
+    over rows y0:y1 and columns x0:x1 is
+    ii[y1, x1] - ii[y0, x1] - ii[y1, x0] + ii[y0, x0].
+    """
+    ii = np.zeros((arr.shape[0] + 1, arr.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(arr, axis=0, dtype=np.float64), axis=1, out=ii[1:, 1:])
+    return ii
+
+
+class LayoutStats:
+    """
+    Downsampled luminance (PIL luma and WCAG relative luminance), texture
+    and saliency integral images of a background. Built once per image;
+    every box query afterwards is O(1) and takes arrays of boxes at a time.
+    """
+
+    def __init__(self, image, max_side=ANALYSIS_MAX_SIDE, saliency=None):
+        width, height = image.size
+
+        small = image.convert("RGB")
+        scale = min(1.0, max_side / max(width, height))
+        if scale < 1.0:
+            small_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            small = small.resize(small_size, Image.BILINEAR, reducing_gap=2.0)
+
+        lum = np.asarray(small.convert("L"), dtype=np.float32)
+        rel_lum = relative_luminance(np.asarray(small))
+
+        gy, gx = np.gradient(lum)
+        texture = np.sqrt(gx ** 2 + gy ** 2)
+
+        if saliency is None:
+            saliency = saliency_map(lum)
+
+        self._build(width, height, {
+            "lum": lum,
+            "rel_lum": rel_lum,
+            "texture": texture,
+            "saliency": saliency,
+        })
+
+    def _build(self, width, height, channels):
+        self.width, self.height = width, height
+        self.channels = channels
+
+        lum = channels["lum"].astype(np.float32)
+        rel_lum = channels["rel_lum"].astype(np.float32)
+        texture = channels["texture"].astype(np.float32)
+
+        self.small_height, self.small_width = lum.shape
+        self.scale_x = self.small_width / self.width
+        self.scale_y = self.small_height / self.height
+
+        self.texture_norm = float(texture.mean()) + 1e-6
+        self.integrals = {
+            "lum": integral_image(lum),
+            "lum_sq": integral_image(lum * lum),
+            "rel_lum": integral_image(rel_lum),
+            "rel_lum_sq": integral_image(rel_lum * rel_lum),
+            "texture": integral_image(texture),
+            "saliency": integral_image(channels["saliency"].astype(np.float32)),
+        }
+
+    @classmethod
+    def from_channels(cls, width, height, channels):
+        """
+        Rebuild stats from previously computed downsampled channels
+        (see .channels) without touching the full-resolution image.
+        """
+        stats = cls.__new__(cls)
+        stats._build(width, height, channels)
+        return stats
+
+    def for_size(self, width, height):
+        """
+        The same analysis addressed in the coordinates of a uniformly
+        resized copy of the image.
+        """
+        if (width, height) == (self.width, self.height):
+            return self
+        stats = copy.copy(self)
+        stats.width, stats.height = width, height
+        stats.scale_x = self.small_width / width
+        stats.scale_y = self.small_height / height
+        return stats
+
+    def box_means(self, key, x0, y0, x1, y1):
+        """
+        Mean of an analysis channel over boxes given in full-resolution
+        pixel coordinates. Coordinates may be scalars or broadcastable arrays.
+        """
+        ii = self.integrals[key]
+
+        sx0 = np.clip(np.floor(np.asarray(x0) * self.scale_x), 0, self.small_width).astype(np.intp)
+        sx1 = np.clip(np.ceil(np.asarray(x1) * self.scale_x), 0, self.small_width).astype(np.intp)
+        sy0 = np.clip(np.floor(np.asarray(y0) * self.scale_y), 0, self.small_height).astype(np.intp)
+        sy1 = np.clip(np.ceil(np.asarray(y1) * self.scale_y), 0, self.small_height).astype(np.intp)
+
+        sx1 = np.maximum(sx1, np.minimum(sx0 + 1, self.small_width))
+        sy1 = np.maximum(sy1, np.minimum(sy0 + 1, self.small_height))
+
+        total = ii[sy1, sx1] - ii[sy0, sx1] - ii[sy1, sx0] + ii[sy0, sx0]
+        area = np.maximum((sx1 - sx0) * (sy1 - sy0), 1)
+        return total / area
+
+    def salient_overlap(self, x0, y0, x1, y1):
+        """
+        How much salient content (faces, products, the subject) candidate
+        text boxes would cover, from 0 to 1. O(1) per box.
+        """
+        return self.box_means("saliency", x0, y0, x1, y1)
+
+
+def _aligned_x(alignment, block_width, w, margin):
+    return np.where(
+        alignment == 0, (w - block_width) / 2,
+        np.where(alignment == 1, margin, w - margin - block_width)
+    )
+
+
+def _zone_scores(stats, ys, block_width, block_height, margin):
+    """
+    Score every (y, alignment) placement of one text block.
+    Returns an array of shape (len(ys), len(ALIGNMENTS)).
+    """
+    align_idx = np.arange(len(ALIGNMENTS))[None, :]
+    y0 = ys[:, None]
+    x0 = _aligned_x(align_idx, block_width, stats.width, margin)
+    x1 = x0 + block_width
+    y1 = y0 + block_height
+
+    texture = stats.box_means("texture", x0, y0, x1, y1) / stats.texture_norm
+    saliency = stats.salient_overlap(x0, y0, x1, y1)
+    contrast = np.abs(stats.box_means("lum", x0, y0, x1, y1) - 128.0) / 128.0
+
+    off_center = np.where(align_idx == 0, 0.0, OFF_CENTER_PENALTY)
+
+    return (
+        TEXTURE_WEIGHT * texture
+        + SALIENCY_WEIGHT * saliency
+        - CONTRAST_WEIGHT * contrast
+        + off_center
+    )
+
+
+def search_layouts(stats, title_size, subtitle_size=None, platform=None,
+                   top_k=3, title_steps=24, subtitle_steps=12, margin_ratio=0.10):
+    """
+    Enumerate candidate (title y, subtitle y, alignment) placements and
+    score them all in one vectorized pass.
+
+    title_size and subtitle_size are the (width, height) of the wrapped text
+    blocks; pass subtitle_size=None when there is no subtitle. Returns up to
+    top_k dicts sorted by score (lower is better).
+    """
+    w, h = stats.width, stats.height
+    margin = int(w * margin_ratio)
+    title_w, title_h = title_size
+
+    zone_top, zone_bottom = TITLE_ZONES.get(platform, TITLE_ZONES[None])
+    has_subtitle = subtitle_size is not None
+
+    if not has_subtitle:
+        # with no subtitle the title sits a little lower for balance
+        zone_top += 0.12
+        zone_bottom = min(zone_bottom + 0.12, 0.75)
+
+    title_lo = int(h * zone_top)
+    title_hi = max(title_lo, min(int(h * zone_bottom), int(h * 0.95) - title_h))
+    title_ys = np.unique(np.linspace(title_lo, title_hi, title_steps).astype(np.intp))
+
+    title_scores = _zone_scores(stats, title_ys, title_w, title_h, margin)
+    title_scores = title_scores + POSITION_WEIGHT * np.abs(title_ys / h - zone_top)[:, None]
+
+    if not has_subtitle:
+        sub_ys = None
+        total = title_scores[:, None, :]
+    else:
+        sub_w, sub_h = subtitle_size
+        sub_hi = max(0, int(h * SUBTITLE_BOTTOM) - sub_h)
+        sub_lo = min(sub_hi, int(h * 0.55))
+        sub_ys = np.unique(np.linspace(sub_lo, sub_hi, subtitle_steps).astype(np.intp))
+
+        sub_scores = _zone_scores(stats, sub_ys, sub_w, sub_h, margin)
+        sub_scores = sub_scores + POSITION_WEIGHT * np.abs(sub_ys / h - SUBTITLE_TARGET)[:, None]
+
+        # (title_y, sub_y, alignment) grid; title and subtitle share an alignment
+        total = title_scores[:, None, :] + SUBTITLE_WEIGHT * sub_scores[None, :, :]
+
+        gap = int(h * 0.04)
+        overlaps = sub_ys[None, :] < title_ys[:, None] + title_h + gap
+        if overlaps.all():
+            # text is too tall for any clean split; let the subtitle sit as low as possible
+            overlaps[:, -1] = False
+        total = np.where(overlaps[:, :, None], np.inf, total)
+
+    flat = total.ravel()
+    k = min(top_k, int(np.isfinite(flat).sum()))
+    if k == 0:
+        return []
+    best = np.argpartition(flat, k - 1)[:k]
+    best = best[np.argsort(flat[best])]
+
+    ti, si, ai = np.unravel_index(best, total.shape)
+    return [
+        {
+            "title_y": int(title_ys[t]),
+            "subtitle_y": int(sub_ys[s]) if has_subtitle else None,
+            "alignment": ALIGNMENTS[a],
+            "score": round(float(flat[i]), 4),
+        }
+        for t, s, a, i in zip(ti, si, ai, best)
+    ]
@@ -6,26 +6,164 @@ import requests
 from io import BytesIO
 from PIL import Image
 import os
+import sys
+import threading
+import time
+
+from backend.postprocessing import PLATFORM_SIZES
+from backend.upscale import upscale_cover
 # print("HF_API_TOKEN loaded:", bool(os.getenv("HF_API_TOKEN")))
 
 
-def load_sd_model(model_name="runwayml/stable-diffusion-v1-5", device="cuda"):
+def load_sd_model(model_name="runwayml/stable-diffusion-v1-5", device="cuda", dtype=None):
     """
     Load a Stable Diffusion pipeline. Returns the pipe object.
+    dtype defaults to float16, or float32 on the CPU.
     """
-    pipe = StableDiffusionPipeline.from_pretrained(model_name, torch_dtype=torch.float16)
+    if dtype is None:
+        dtype = torch.float32 if device == "cpu" else torch.float16
+    pipe = StableDiffusionPipeline.from_pretrained(model_name, torch_dtype=dtype)
     if device:
         pipe = pipe.to(device)
     return pipe
 
-def generate_background(pipe, prompt, guidance_scale=7.5, num_steps=28):
+def generate_background(pipe, prompt, guidance_scale=7.5, num_steps=28, width=None, height=None, seed=None):
     """
     Generate a single image from prompt using the provided pipeline.
+    width/height default to the pipeline's native size (512 for SD 1.5).
     Returns a PIL Image.
     """
-    result = pipe(prompt, guidance_scale=guidance_scale, num_inference_steps=num_steps)
+    generator = torch.Generator(device=pipe.device).manual_seed(seed) if seed is not None else None
+    result = pipe(prompt, guidance_scale=guidance_scale, num_inference_steps=num_steps,
+                  width=width, height=height, generator=generator)
     return result.images[0]
 
+
+# cheap generation sizes (multiples of 8) per aspect group; upscaled afterwards
+BASE_RESOLUTIONS = {
+    "square": (512, 512),
+    "landscape": (768, 432),
+    "portrait": (432, 768),
+}
+
+
+def platform_group(size):
+    w, h = size
+    ratio = w / h
+    if ratio > 1.2:
+        return "landscape"
+    if ratio < 1 / 1.2:
+        return "portrait"
+    return "square"
+
+
+def base_resolution(platform):
+    """
+    Generation size for a platform: the base resolution of its aspect group.
+    """
+    return BASE_RESOLUTIONS[platform_group(PLATFORM_SIZES.get(platform, PLATFORM_SIZES["Instagram"]))]
+
+
+def _current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # no procfs (or no SC_PAGE_SIZE on Windows): fall back to the process high-water mark
+        try:
+            import resource
+        except ImportError:
+            return 0
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+class StageProfiler:
+    """
+    Times named stages and samples resident memory while each one runs, so
+    every stage reports its own peak, both absolute and as growth over the
+    resident size at the start of the stage. CUDA peaks are added when
+    available.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stages = []
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def _sample(self):
+        while not self._stop.wait(self.profiler.interval):
+            self._peak = max(self._peak, _current_rss())
+
+    def __enter__(self):
+        self._cuda = torch.cuda.is_available()
+        if self._cuda:
+            torch.cuda.reset_peak_memory_stats()
+            self._cuda_start = torch.cuda.memory_allocated()
+        self._rss_start = self._peak = _current_rss()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        self._stop.set()
+        self._sampler.join()
+        peak = max(self._peak, _current_rss())
+        record = {
+            "stage": self.name,
+            "seconds": round(seconds, 3),
+            "peak_rss_bytes": peak,
+            "peak_rss_delta_bytes": peak - self._rss_start,
+        }
+        if self._cuda:
+            peak_cuda = torch.cuda.max_memory_allocated()
+            record["peak_cuda_bytes"] = peak_cuda
+            record["peak_cuda_delta_bytes"] = peak_cuda - self._cuda_start
+        self.profiler.stages.append(record)
+        return False
+
+
+def generate_for_platform(pipe, prompt, platform="Instagram", guidance_scale=7.5, num_steps=28,
+                          seed=None, upscale=True, workers=None):
+    """
+    Generate a platform-sized background cheaply: run the pipeline at the
+    base resolution of the platform's aspect group, then cover-crop and
+    upscale to the platform size with the tiled CPU upscaler.
+
+    Returns (image, report), where report lists the latency and peak memory
+    of each stage.
+    """
+    out_size = PLATFORM_SIZES.get(platform, PLATFORM_SIZES["Instagram"])
+    base_w, base_h = base_resolution(platform)
+    profiler = StageProfiler()
+
+    with profiler.stage("generate"):
+        image = generate_background(pipe, prompt, guidance_scale, num_steps,
+                                    width=base_w, height=base_h, seed=seed)
+    if upscale:
+        with profiler.stage("upscale"):
+            image = upscale_cover(image, out_size, workers=workers)
+
+    report = {
+        "platform": platform,
+        "base_size": [base_w, base_h],
+        "output_size": list(image.size),
+        "stages": profiler.stages,
+        "total_seconds": round(sum(s["seconds"] for s in profiler.stages), 3),
+    }
+    return image, report
+
 VARIANTS = [
     {
         "name": "Bold Title",
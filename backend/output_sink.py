@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import json
+import os
+import queue
+import threading
+import time
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+DEFAULT_QUEUE_SIZE = 16
+
+
+def atomic_write(path, data):
+    # unique per process and thread, so concurrent writers never share a temp file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class OutputSink:
+    """
+    Writes render outputs (posters, metadata) to a directory off the
+    request path.
+
+    submit() only enqueues bytes the caller already has in memory (and can
+    serve directly, e.g. to a download button); a writer thread drains the
+    bounded queue with atomic writes. The directory is capped by total
+    size and file age: the writer keeps an oldest-first index of the files,
+    built by one scan at start-up, and evicts from its front after every
+    write instead of rescanning.
+    """
+
+    def __init__(self, output_dir, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.output_dir = output_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.errors = []
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._files = OrderedDict()
+        self._total_bytes = 0
+        self._scan()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _scan(self):
+        found = []
+        for entry in os.scandir(self.output_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name, st.st_size))
+        for mtime, name, size in sorted(found):
+            self._files[name] = (size, mtime)
+            self._total_bytes += size
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def submit(self, filename, data):
+        """
+        Queue bytes to be written as output_dir/filename. Blocks while the
+        queue is full. Returns the path the file will have.
+        """
+        self._queue.put((filename, data))
+        return os.path.join(self.output_dir, filename)
+
+    def submit_json(self, filename, obj):
+        return self.submit(filename, json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+    def flush(self):
+        """
+        Wait until everything submitted so far has been written.
+        """
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except OSError as e:
+                self.errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, filename, data):
+        atomic_write(os.path.join(self.output_dir, filename), data)
+
+        previous = self._files.pop(filename, None)
+        if previous:
+            self._total_bytes -= previous[0]
+        self._files[filename] = (len(data), time.time())
+        self._total_bytes += len(data)
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        cutoff = time.time() - self.max_age if self.max_age else None
+        while len(self._files) > 1:
+            name, (size, mtime) = next(iter(self._files.items()))
+            over_size = self.max_bytes is not None and self._total_bytes > self.max_bytes
+            expired = cutoff is not None and mtime < cutoff
+            if not over_size and not expired:
+                return
+            self._files.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except FileNotFoundError:
+                pass
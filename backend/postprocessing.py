@@ -1,7 +1,18 @@
 from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
+import io
 import json
 import os
 import re
+import time
+
+import numpy as np
+
+from backend.glyph_atlas import cached_font
+from backend.font_metrics import greedy_line_counts, load_metrics
+from backend.contrast import choose_line_styles, line_boxes
+from backend.layout import LayoutStats, search_layouts
+from backend.output_sink import atomic_write
+from backend.text_effects import render_styled_lines
 
 
 MAX_TITLE_SCALE = 0.12
@@ -16,7 +27,8 @@ BRIGHTNESS_THRESHOLD = 145
 def _load_font(font_path, size):
     try:
         if font_path and os.path.exists(font_path):
-            return ImageFont.truetype(font_path, size=size)
+            # faces are shared across variants, platforms and shrink attempts
+            return cached_font(font_path, size)
     except Exception:
         pass
     # fallback
@@ -25,25 +37,34 @@ def _load_font(font_path, size):
     except Exception:
         return None
 
-def draw_text_adaptive(draw, position, text, font, text_color, brightness):
+def _legacy_effect(text_color, brightness):
+    if text_color == "black" and brightness > 180:
+        return "stroke"
+    if text_color == "white" and brightness < 100:
+        return "shadow"
+    return "none"
+
+def draw_text_adaptive(draw, position, text, font, text_color, brightness, effect=None, effect_color="black"):
     x, y = position
 
-    if text_color == "black" and brightness > 180:
-        # light background → subtle dark stroke
+    if effect is None:
+        effect = _legacy_effect(text_color, brightness)
+
+    if effect == "stroke":
+        # subtle outline in the contrasting colour
         stroke_width = 2
-        stroke_fill = "black"
         draw.text(
             (x, y),
             text,
             font=font,
             fill=text_color,
             stroke_width=stroke_width,
-            stroke_fill=stroke_fill
+            stroke_fill=effect_color
         )
 
-    elif text_color == "white" and brightness < 100:
-        # dark background → subtle shadow
-        draw.text((x+2, y+2), text, font=font, fill="black")
+    elif effect == "shadow":
+        # subtle shadow
+        draw.text((x+2, y+2), text, font=font, fill=effect_color)
         draw.text((x, y), text, font=font, fill=text_color)
 
     else:
@@ -143,7 +164,95 @@ def find_low_texture_slice(image, slice_height_ratio=0.12):
     return best_y
 
 
-def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle_font_path=None, text_color="#FFFFFF", variant=None, platform=None):
+def _block_width(draw, lines, font):
+    return max((get_text_size(draw, line, font)[0] for line in lines), default=0)
+
+def _block_height(draw, lines, font, spacing):
+    if not lines:
+        return 0
+    heights = [get_text_size(draw, line, font)[1] for line in lines]
+    return sum(heights) + spacing * (len(lines) - 1)
+
+def _position_lines(draw, lines, font, y_start, spacing, w, alignment="center", margin=0):
+    positions = []
+    current_y = y_start
+
+    for line in lines:
+        line_width, line_height = get_text_size(draw, line, font)
+
+        if alignment == "left":
+            x = margin
+        elif alignment == "right":
+            x = w - margin - line_width
+        else:
+            x = (w - line_width) // 2
+        positions.append((line, x, current_y))
+        current_y += line_height + spacing
+
+    return positions
+
+def _presize_from_metrics(font_path, text, scale, size, min_scale, size_for_scale, max_width, max_lines, fits):
+    # Jump to the first step of the 0.92 shrink schedule whose greedy wrap,
+    # computed from the font's metrics table, fits max_lines. The table
+    # measures advances while wrap_text measures ink, so step back up while
+    # the real font (fits(size)) still fits; the caller's shrink loop then
+    # verifies the result, giving the same size as the plain shrink search.
+    words = text.split()
+    if not words:
+        return scale, size
+    try:
+        metrics = load_metrics(font_path)
+    except Exception:
+        return scale, size
+
+    scales, sizes = [scale], [size]
+    while scales[-1] > min_scale:
+        scales.append(scales[-1] * 0.92)
+        sizes.append(size_for_scale(scales[-1]))
+
+    counts = greedy_line_counts(
+        metrics.word_widths(words),
+        metrics.text_width(" "),
+        max_width / np.maximum(np.array(sizes, dtype=np.float64), 1),
+    )
+    fitting = np.flatnonzero(counts <= max_lines)
+    i = fitting[0] if fitting.size else len(scales) - 1
+    while i > 0 and fits(sizes[i - 1]):
+        i -= 1
+    return scales[i], sizes[i]
+
+def _fallback_title_y(image, platform, has_subtitle):
+    h = image.height
+    try:
+        detected_y = find_low_texture_slice(image)
+
+        if platform == "YouTube":
+            #  avoid extreme top
+            safe_top = int(h * 0.18)
+            safe_bottom = int(h * 0.65)
+            title_y_start = max(safe_top, min(detected_y, safe_bottom))
+
+        elif platform == "LinkedIn":
+            # Slightly centered feel
+            safe_top = int(h * 0.10)
+            safe_bottom = int(h * 0.60)
+            title_y_start = max(safe_top, min(detected_y, safe_bottom))
+
+        else:
+            # Instagram + preview default
+            title_y_start = max(int(h * 0.08), min(detected_y, int(h * 0.6)))
+
+        # If no subtitle → shift slightly downward for balance
+        if not has_subtitle:
+            title_y_start += int(h * 0.12)
+
+        return max(int(h * 0.05), min(title_y_start, int(h * 0.75)))
+
+    except Exception:
+        return int(h * 0.10)
+
+
+def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle_font_path=None, text_color="#FFFFFF", variant=None, platform=None, layout_stats=None, text_layer=False):
     if variant is None:
         variant = {}
 
@@ -189,9 +298,6 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
     title_size = int(base_dimension * title_scale)
     sub_size   = int(base_dimension * sub_scale)
 
-    title_font = _load_font(title_font_path, title_size)
-    sub_font = _load_font(subtitle_font_path, sub_size)
-
 
     # compute positions (centered)
     title_text = title or ""
@@ -214,6 +320,13 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
     MAX_TITLE_LINES = 3
     # MIN_TITLE_SCALE = 0.045
 
+    title_scale, title_size = _presize_from_metrics(
+        title_font_path, title_text, title_scale, title_size, MIN_TITLE_SCALE,
+        lambda scale: int(h * scale), max_text_width, MAX_TITLE_LINES,
+        lambda size: len(wrap_text(draw, title_text, _load_font(title_font_path, size), max_text_width)) <= MAX_TITLE_LINES,
+    )
+    title_font = _load_font(title_font_path, title_size)
+
     title_lines = wrap_text(draw, title_text, title_font, max_text_width)
     # original_title_line_count = len(title_lines)
 
@@ -230,67 +343,9 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
     title_lines = title_lines[:MAX_TITLE_LINES]
 
     line_spacing = int(title_size * 0.2)
-   # Vision-aware placement
-    try:
-        detected_y = find_low_texture_slice(image)
-
-        if platform == "YouTube":
-            #  avoid extreme top
-            safe_top = int(h * 0.18)
-            safe_bottom = int(h * 0.65)
-            title_y_start = max(safe_top, min(detected_y, safe_bottom))
-
-        elif platform == "LinkedIn":
-            # Slightly centered feel
-            safe_top = int(h * 0.10)
-            safe_bottom = int(h * 0.60)
-            title_y_start = max(safe_top, min(detected_y, safe_bottom))
-
-        else:
-            # Instagram + preview default
-            title_y_start = max(int(h * 0.08), min(detected_y, int(h * 0.6)))
-
-        # If no subtitle → shift slightly downward for balance
-        if not has_subtitle:
-            title_y_start += int(h * 0.12)
-
-        title_y_start = max(int(h * 0.05), min(title_y_start, int(h * 0.75)))
-
-    except Exception:
-        title_y_start = int(h * 0.10)
-
-        # vertical_adjust = variant.get("vertical_adjust", 0) / 100
-        # title_y_start += int(h * vertical_adjust)
-        # title_y_start = max(int(h * 0.05), min(title_y_start, int(h * 0.75)))
-       
-    # except Exception:
-    #     # fallback to default placement
-    #     title_y_start = max(int(h * 0.08), int(h * 0.05))
-
-    title_positions = []
-    current_y = title_y_start
-
-    for line in title_lines:
-        bbox = draw.textbbox((0, 0), line, font=title_font)
-        line_width = bbox[2] - bbox[0]
-        line_height = bbox[3] - bbox[1]
-
-        title_x = (w - line_width) // 2
-        title_positions.append((line, title_x, current_y))
-        current_y += line_height + line_spacing
-
-    # Calculate total height AFTER building positions
-    if title_positions:
-        first_y = title_positions[0][2]
-        last_line, _, last_y = title_positions[-1]
-        bbox = draw.textbbox((0, 0), last_line, font=title_font)
-        last_height = bbox[3] - bbox[1]
-        total_title_height = (last_y - first_y) + last_height
-    else:
-        first_y = title_y_start
-        total_title_height = title_size
 
     # Prevent title block overflow
+    total_title_height = _block_height(draw, title_lines, title_font, line_spacing) or title_size
     max_allowed_height = int(h * 0.45)
     if total_title_height > max_allowed_height:
         shrink_ratio = max_allowed_height / total_title_height
@@ -300,18 +355,7 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
         # Re-wrap
         title_lines = wrap_text(draw, title_text, title_font, max_text_width)
         title_lines = title_lines[:3]
-
-        title_positions = []
-        current_y = title_y_start
-
-        for line in title_lines:
-            bbox = draw.textbbox((0, 0), line, font=title_font)
-            line_width = bbox[2] - bbox[0]
-            line_height = bbox[3] - bbox[1]
-
-            title_x = (w - line_width) // 2
-            title_positions.append((line, title_x, current_y))
-            current_y += line_height + line_spacing
+        total_title_height = _block_height(draw, title_lines, title_font, line_spacing) or title_size
 
     # -------- SUBTITLE WRAPPING LOGIC --------
     SAFE_MARGIN = int(w * 0.10)
@@ -321,6 +365,13 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
     MAX_SUB_LINES = 2
     MIN_SUB_SCALE = 0.03
 
+    sub_scale, sub_size = _presize_from_metrics(
+        subtitle_font_path, subtitle_text, sub_scale, sub_size, MIN_SUB_SCALE,
+        lambda scale: int(int(base_dimension * scale) * 0.95), max_sub_width, MAX_SUB_LINES,
+        lambda size: len(wrap_text(draw, subtitle_text, _load_font(subtitle_font_path, size), max_sub_width)) <= MAX_SUB_LINES,
+    )
+    sub_font = _load_font(subtitle_font_path, sub_size)
+
     subtitle_lines = wrap_text(draw, subtitle_text, sub_font, max_sub_width)
     # original_sub_line_count = len(subtitle_lines)
 
@@ -336,20 +387,49 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
 
     sub_line_spacing = int(sub_size * 0.30)
 
+    # -------- PLACEMENT --------
+    # Score a grid of candidate placements; fall back to the single
+    # low-texture slice if the search cannot run.
+    title_alignment = "center"
     sub_y_start = int(h * 0.80)
+    layout_candidates = []
+    # precomputed analysis (e.g. from the background catalog) skips re-reading pixels
+    stats = layout_stats.for_size(w, h) if layout_stats is not None else None
 
-    subtitle_positions = []
+    try:
+        if stats is None:
+            stats = LayoutStats(image)
+        title_block = (_block_width(draw, title_lines, title_font), total_title_height)
+        sub_block = None
+        if subtitle_lines:
+            sub_block = (
+                _block_width(draw, subtitle_lines, sub_font),
+                _block_height(draw, subtitle_lines, sub_font, sub_line_spacing),
+            )
 
-    current_y = sub_y_start
+        layout_candidates = search_layouts(
+            stats,
+            title_block,
+            sub_block,
+            platform=platform,
+            top_k=variant.get("layout_top_k", 3),
+        )
+        best = layout_candidates[0]
+        title_y_start = best["title_y"]
+        title_alignment = best["alignment"]
+        if best["subtitle_y"] is not None:
+            sub_y_start = best["subtitle_y"]
 
-    for line in subtitle_lines:
-        bbox = draw.textbbox((0, 0), line, font=sub_font)
-        line_width = bbox[2] - bbox[0]
-        line_height = bbox[3] - bbox[1]
+    except Exception:
+        title_y_start = _fallback_title_y(image, platform, has_subtitle)
 
-        sub_x = (w - line_width) // 2
-        subtitle_positions.append((line, sub_x, current_y))
-        current_y += line_height + sub_line_spacing
+    first_y = title_y_start
+    title_positions = _position_lines(
+        draw, title_lines, title_font, title_y_start, line_spacing, w, title_alignment, SAFE_MARGIN
+    )
+    subtitle_positions = _position_lines(
+        draw, subtitle_lines, sub_font, sub_y_start, sub_line_spacing, w, title_alignment, SAFE_MARGIN
+    )
 
     # Now fix overflow AFTER building positions
     if subtitle_positions:
@@ -384,60 +464,59 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
                 for (line, x, y) in subtitle_positions
             ]
 
-    pad = int(title_size * 0.8)
-    title_box = (
-        0,
-        max(0, int(first_y - pad)),
-        w,
-        min(h, int(first_y + total_title_height + pad))
-    )
-
-
-    brightness = get_average_brightness(image.convert("RGB"), title_box)
-
-    # choose text color
-    if brightness < 145:
-        text_color = "white"
-    else:
-        text_color = "black"
-
-    # Draw text with shadow for readability
+    # -------- CONTRAST --------
+    # One batched luminance query under every line's glyph box decides
+    # colour and effect per line.
     try:
-        if text_color == "white":
-            for line, x, y in title_positions:
-                draw_text_adaptive(
-                    draw,
-                    (x, y),
-                    line,
-                    title_font,
-                    text_color,
-                    brightness
-                )
-
-        else:
-            for line, x, y in title_positions:
-                draw.text((x, y), line, font=title_font, fill=text_color)
+        if stats is None:
+            stats = LayoutStats(image)
+        title_styles = choose_line_styles(stats, line_boxes(draw, title_positions, title_font), large_text=True)
+        sub_styles = choose_line_styles(stats, line_boxes(draw, subtitle_positions, sub_font))
+    except Exception:
+        pad = int(title_size * 0.8)
+        title_box = (
+            0,
+            max(0, int(first_y - pad)),
+            w,
+            min(h, int(first_y + total_title_height + pad))
+        )
+        fallback_brightness = get_average_brightness(image.convert("RGB"), title_box)
+        fallback_color = "white" if fallback_brightness < BRIGHTNESS_THRESHOLD else "black"
+        fallback_style = {
+            "text_color": fallback_color,
+            "effect": _legacy_effect(fallback_color, fallback_brightness),
+            "effect_color": "black",
+            "brightness": round(fallback_brightness, 2),
+        }
+        title_styles = [fallback_style] * len(title_positions)
+        sub_styles = [fallback_style] * len(subtitle_positions)
+
+    if title_styles:
+        text_color = title_styles[0]["text_color"]
+        brightness = sum(s["brightness"] for s in title_styles) / len(title_styles)
+        contrast_strategy = title_styles[0]["effect"]
+    else:
+        text_color = sub_styles[0]["text_color"] if sub_styles else "white"
+        brightness = sub_styles[0]["brightness"] if sub_styles else 0.0
+        contrast_strategy = sub_styles[0]["effect"] if sub_styles else "none"
 
-            for line, x, y in subtitle_positions:
-                draw.text((x, y), line, font=sub_font, fill=text_color)
+    # text_layer=True returns only the text on a transparent canvas (for animation)
+    target = Image.new("RGBA", image.size, (0, 0, 0, 0)) if text_layer else image
 
-        
-        for line, x, y in subtitle_positions:
-            if text_color == "white":
-                sub_fill = (235, 235, 235)  # softer white
-            else:
-                sub_fill = (30, 30, 30)     # softer black
-
-            draw_text_adaptive(
-                draw,
-                (x, y),
-                line,
-                sub_font,
-                sub_fill,
-                brightness
-            )
+    # Draw text; glyph masks are rendered once per block and effects derived from them
+    try:
+        render_styled_lines(target, title_positions, title_font, title_styles)
+        render_styled_lines(
+            target,
+            subtitle_positions,
+            sub_font,
+            sub_styles,
+            # softer white / softer black
+            fill_for=lambda style: (235, 235, 235) if style["text_color"] == "white" else (30, 30, 30),
+        )
 
     except Exception:
+        draw = ImageDraw.Draw(target)
         for line, x, y in title_positions:
             draw.text((x, y), line, fill=text_color)
         for line, x, y in subtitle_positions:
@@ -450,15 +529,14 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
         "text_color": text_color,
         "layout": "Title at top-center, subtitle at bottom-center",
         "background_brightness": round(brightness, 2),
-        "contrast_strategy": (
-            "stroke" if text_color == "black" and brightness > 180
-            else "shadow" if text_color == "white" and brightness < 100
-            else "none"
-        ),
+        "contrast_strategy": contrast_strategy,
+        "line_styles": {"title": title_styles, "subtitle": sub_styles},
         "emoji_removed": emoji_removed,
         "title_truncated": title_overflow,
         "subtitle_truncated": subtitle_overflow,
         "long_word_detected": has_long_word,
+        "title_alignment": title_alignment,
+        "layout_candidates": layout_candidates,
 
     }
     if variant:
@@ -469,43 +547,100 @@ def overlay_text(img, title="TITLE", subtitle="", title_font_path=None, subtitle
         metadata["layout"] = "top-center/bottom-center"
 
 
+    if text_layer:
+        return target, metadata
     return image.convert("RGB"), metadata
 
+THUMBNAIL_WIDTHS = (260, 420)
+
+
+def make_thumbnails(image, widths=THUMBNAIL_WIDTHS, fmt="JPEG", quality=85):
+    """
+    Downscale an image to each display width and encode it once.
+    Returns {width: encoded bytes}, ready to hand to st.image.
+    """
+    image = image.convert("RGB")
+    thumbs = {}
+
+    for width in widths:
+        thumb_w = min(width, image.width)
+        thumb_h = max(1, round(image.height * thumb_w / image.width))
+
+        # reducing_gap lets PIL do a cheap integer box reduce before the resample
+        thumb = image.resize((thumb_w, thumb_h), Image.BILINEAR, reducing_gap=2.0)
+
+        buf = io.BytesIO()
+        thumb.save(buf, format=fmt, quality=quality)
+        thumbs[width] = buf.getvalue()
+
+    return thumbs
+
+_METADATA_DIRS = set()
+
+
 def save_layout_metadata(outpath, metadata):
-    os.makedirs(os.path.dirname(outpath), exist_ok=True)
-    with open(outpath, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
+    # create each directory once per process; write compact JSON atomically
+    out_dir = os.path.dirname(outpath)
+    if out_dir not in _METADATA_DIRS:
+        os.makedirs(out_dir or ".", exist_ok=True)
+        _METADATA_DIRS.add(out_dir)
+    atomic_write(outpath, json.dumps(metadata, separators=(",", ":")).encode("utf-8"))
+
+
+PLATFORM_SIZES = {
+    "Instagram": (1080, 1080),
+    "LinkedIn": (1200, 627),
+    "YouTube": (1280, 720),
+}
+
+
+def cover_box(src_w, src_h, W, H):
+    """
+    Largest centred (x0, y0, x1, y1) box of aspect W:H inside a source image.
+    """
+    if src_w / src_h > W / H:
+        box_w, box_h = src_h * W / H, src_h
+    else:
+        box_w, box_h = src_w, src_w * H / W
+    x0 = (src_w - box_w) / 2
+    y0 = (src_h - box_h) / 2
+    return x0, y0, x0 + box_w, y0 + box_h
 
 
-def export_with_text(base_image, title, subtitle, title_font_path, subtitle_font_path, variant):
-    platforms = {
-        "Instagram": (1080, 1080),
-        "LinkedIn": (1200, 627),
-        "YouTube": (1280, 720),
-    }
+def cover_resize(base_image, W, H):
+    # scale to cover W x H, then center-crop
+    if base_image.size == (W, H):
+        return base_image
 
-    exports = {}
+    img_ratio = base_image.width / base_image.height
+    target_ratio = W / H
 
-    for name, (W, H) in platforms.items():
-        img_ratio = base_image.width / base_image.height
-        target_ratio = W / H
+    if img_ratio > target_ratio:
+        new_h = H
+        new_w = int(H * img_ratio)
+    else:
+        new_w = W
+        new_h = int(W / img_ratio)
 
-        if img_ratio > target_ratio:
-            new_h = H
-            new_w = int(H * img_ratio)
-        else:
-            new_w = W
-            new_h = int(W / img_ratio)
+    resized = base_image.resize((new_w, new_h), Image.LANCZOS)
 
-        resized = base_image.resize((new_w, new_h), Image.LANCZOS)
+    left = (new_w - W) // 2
+    top = (new_h - H) // 2
+    return resized.crop((left, top, left + W, top + H))
+
+
+def export_with_text(base_image, title, subtitle, title_font_path, subtitle_font_path, variant, with_metadata=False):
+    # with_metadata=True also returns each platform's overlay_text metadata
+    exports = {}
+    metadata = {}
 
-        left = (new_w - W) // 2
-        top = (new_h - H) // 2
-        cropped = resized.crop((left, top, left + W, top + H))
+    for name, (W, H) in PLATFORM_SIZES.items():
+        cropped = cover_resize(base_image, W, H)
         variant_with_platform = variant.copy()
         variant_with_platform["platform"] = name  # Instagram / LinkedIn / YouTube
 
-        final_img, _ = overlay_text(
+        render_start = time.perf_counter()
+        final_img, meta = overlay_text(
             cropped,
             title=title,
             subtitle=subtitle,
@@ -515,7 +650,10 @@ def export_with_text(base_image, title, subtitle, title_font_path, subtitle_font
         )
 
         exports[name] = final_img
+        metadata[name] = dict(meta, render_seconds=time.perf_counter() - render_start)
 
+    if with_metadata:
+        return exports, metadata
     return exports
 
 # def export_for_platforms(image):
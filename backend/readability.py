@@ -0,0 +1,186 @@
+from PIL import Image
+import os
+
+import numpy as np
+
+from backend.contrast import contrast_ratio, relative_luminance
+from backend.font_metrics import greedy_line_counts, load_metrics
+from backend.layout import TITLE_ZONES, SUBTITLE_TARGET
+
+
+SCORE_GRID = (128, 128)
+REFERENCE_CANVAS = (1080, 1080)
+
+# column band the centred text occupies (overlay_text's 10% safe margins)
+TEXT_COLUMNS = (0.10, 0.90)
+SUBTITLE_WINDOW = 0.10
+
+TEXTURE_SOFTNESS = 6.0
+CONTRAST_CAP = 7.0
+TITLE_WEIGHT = 0.65
+
+
+def _grid_channels(image):
+    small = image.convert("RGB").resize(SCORE_GRID, Image.BILINEAR, reducing_gap=2.0)
+    lum = np.asarray(small.convert("L"), dtype=np.float32)
+    return lum, relative_luminance(np.asarray(small))
+
+
+def _band_fraction(text, font_path, scale, spacing, max_lines):
+    # height of the wrapped text block as a fraction of a reference canvas
+    W, H = REFERENCE_CANVAS
+    size = min(W, H) * scale
+    words = text.split()
+    if not words:
+        return 0.0
+    try:
+        metrics = load_metrics(font_path)
+        lines = int(greedy_line_counts(metrics.word_widths(words), metrics.text_width(" "),
+                                       [W * 0.8 / size])[0])
+        line_height = metrics.line_height
+    except Exception:
+        lines, line_height = 1, 1.2
+    lines = min(lines, max_lines)
+    return size * (lines * line_height + (lines - 1) * spacing) / H
+
+
+def _band_stats(rows, band):
+    """
+    Mean of row values over every band of `band` rows, for the whole stack
+    at once: (N, H) -> (N, H - band + 1).
+    """
+    cs = np.concatenate([np.zeros((rows.shape[0], 1)), np.cumsum(rows, axis=1, dtype=np.float64)], axis=1)
+    return (cs[:, band:] - cs[:, :-band]) / band
+
+
+def _zone_readability(texture_rows, rel_rows, rel_sq_rows, band, lo, hi):
+    texture = _band_stats(texture_rows, band)[:, lo:hi]
+    mean_rel = _band_stats(rel_rows, band)[:, lo:hi]
+    mean_rel_sq = _band_stats(rel_sq_rows, band)[:, lo:hi]
+    std_rel = np.sqrt(np.maximum(mean_rel_sq - mean_rel ** 2, 0.0))
+
+    # best of white and black text against a background one std worse than the mean
+    ratio = np.maximum(
+        contrast_ratio(1.0, np.minimum(mean_rel + std_rel, 1.0)),
+        contrast_ratio(0.0, np.maximum(mean_rel - std_rel, 0.0)),
+    )
+    contrast = np.minimum(ratio, CONTRAST_CAP) / CONTRAST_CAP
+    calm = TEXTURE_SOFTNESS / (TEXTURE_SOFTNESS + texture)
+
+    readability = contrast * calm
+    best = readability.argmax(axis=1)
+    idx = np.arange(len(best))
+    return readability[idx, best], texture[idx, best], ratio[idx, best]
+
+
+def score_channel_stack(lum, rel_lum, title, subtitle="", title_font_path=None,
+                        subtitle_font_path=None, variant=None, platform=None):
+    """
+    Score (N, H, W) luma and relative-luminance stacks on the SCORE_GRID.
+    Returns a list of per-background score dicts in input order.
+    """
+    variant = variant or {}
+    h = lum.shape[1]
+    c0, c1 = (int(lum.shape[2] * f) for f in TEXT_COLUMNS)
+
+    gy, gx = np.gradient(lum, axis=(1, 2))
+    texture = np.sqrt(gx ** 2 + gy ** 2)[:, :, c0:c1].mean(axis=2)
+    rel = rel_lum[:, :, c0:c1]
+    rel_rows = rel.mean(axis=2)
+    rel_sq_rows = (rel * rel).mean(axis=2)
+
+    title_band = max(1, round(h * _band_fraction(title or "", title_font_path,
+                                                 variant.get("title_scale", 0.10), 0.2, 3)))
+    zone_top, zone_bottom = TITLE_ZONES.get(platform, TITLE_ZONES[None])
+    lo = min(int(h * zone_top), h - title_band)
+    hi = max(lo + 1, min(int(h * zone_bottom), h - title_band + 1))
+    title_score, title_texture, title_ratio = _zone_readability(
+        texture, rel_rows, rel_sq_rows, title_band, lo, hi
+    )
+
+    n = lum.shape[0]
+    if subtitle and subtitle.strip():
+        sub_band = max(1, round(h * _band_fraction(subtitle, subtitle_font_path,
+                                                   variant.get("subtitle_scale", 0.045), 0.3, 2)))
+        lo = min(int(h * (SUBTITLE_TARGET - SUBTITLE_WINDOW)), h - sub_band)
+        hi = max(lo + 1, min(int(h * (SUBTITLE_TARGET + SUBTITLE_WINDOW)), h - sub_band + 1))
+        sub_score, sub_texture, sub_ratio = _zone_readability(
+            texture, rel_rows, rel_sq_rows, sub_band, lo, hi
+        )
+        total = TITLE_WEIGHT * title_score + (1 - TITLE_WEIGHT) * sub_score
+    else:
+        sub_score = sub_texture = sub_ratio = np.full(n, np.nan)
+        total = title_score
+
+    return [
+        {
+            "score": round(float(total[i]), 4),
+            "title_readability": round(float(title_score[i]), 4),
+            "title_texture": round(float(title_texture[i]), 3),
+            "title_contrast_ratio": round(float(title_ratio[i]), 2),
+            "subtitle_readability": None if np.isnan(sub_score[i]) else round(float(sub_score[i]), 4),
+            "subtitle_texture": None if np.isnan(sub_texture[i]) else round(float(sub_texture[i]), 3),
+            "subtitle_contrast_ratio": None if np.isnan(sub_ratio[i]) else round(float(sub_ratio[i]), 2),
+        }
+        for i in range(n)
+    ]
+
+
+def _rank(names, scores):
+    ranked = [dict(score, name=name) for name, score in zip(names, scores)]
+    ranked.sort(key=lambda r: r["score"], reverse=True)
+    return ranked
+
+
+def rank_backgrounds(backgrounds, title, subtitle="", title_font_path=None,
+                     subtitle_font_path=None, variant=None, platform=None, names=None):
+    """
+    Rank candidate backgrounds (PIL images or file paths) for how readable
+    the title and subtitle would be on them, without rendering any poster.
+    Every background is downsampled onto one small grid and the whole stack
+    is scored in a single NumPy pass. Returns dicts sorted best first, each
+    with its name (the path, or the index when given images).
+    """
+    lums, rels, labels = [], [], []
+    for i, bg in enumerate(backgrounds):
+        if isinstance(bg, (str, os.PathLike)):
+            with Image.open(bg) as img:
+                img.draft("RGB", (SCORE_GRID[0] * 2, SCORE_GRID[1] * 2))
+                lum, rel = _grid_channels(img)
+            label = os.fspath(bg)
+        else:
+            lum, rel = _grid_channels(bg)
+            label = i
+        lums.append(lum)
+        rels.append(rel)
+        labels.append(label)
+
+    if not lums:
+        return []
+    scores = score_channel_stack(np.stack(lums), np.stack(rels), title, subtitle,
+                                 title_font_path, subtitle_font_path, variant, platform)
+    return _rank(names or labels, scores)
+
+
+def rank_catalog(catalog, title, subtitle="", title_font_path=None, subtitle_font_path=None,
+                 variant=None, platform=None, names=None):
+    """
+    rank_backgrounds for catalogued images, scoring the catalog's stacked
+    sidecar channels (resampled once per catalog change) without decoding
+    any image.
+    """
+    all_names, stacks = catalog.stacked_channels(("lum", "rel_lum"), SCORE_GRID)
+    lum, rel_lum = stacks["lum"], stacks["rel_lum"]
+    if names is not None:
+        names = list(names)
+        position = {name: i for i, name in enumerate(all_names)}
+        idx = np.array([position[name] for name in names], dtype=np.intp)
+        lum, rel_lum = lum[idx], rel_lum[idx]
+    else:
+        names = all_names
+
+    if not names:
+        return []
+    scores = score_channel_stack(lum, rel_lum, title, subtitle,
+                                 title_font_path, subtitle_font_path, variant, platform)
+    return _rank(names, scores)
@@ -0,0 +1,167 @@
+import atexit
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+# metadata keys stored as their own columns; everything else goes to `extra`
+COLUMNS = (
+    ("ts", "REAL"),
+    ("title", "TEXT"),
+    ("subtitle", "TEXT"),
+    ("variant", "TEXT"),
+    ("platform", "TEXT"),
+    ("background", "TEXT"),
+    ("title_font", "TEXT"),
+    ("subtitle_font", "TEXT"),
+    ("text_color", "TEXT"),
+    ("background_brightness", "REAL"),
+    ("contrast_strategy", "TEXT"),
+    ("title_alignment", "TEXT"),
+    ("title_truncated", "INTEGER"),
+    ("subtitle_truncated", "INTEGER"),
+    ("emoji_removed", "INTEGER"),
+    ("long_word_detected", "INTEGER"),
+    ("render_seconds", "REAL"),
+    ("extra", "TEXT"),
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+INDEXED = ("variant", "platform", "title_font", "subtitle_font", "title_truncated", "subtitle_truncated")
+FLAGS = ("title_truncated", "subtitle_truncated", "emoji_removed", "long_word_detected")
+
+
+class RenderLog:
+    """
+    Append-only SQLite log of overlay_text renders, one row per render.
+
+    log() only appends to an in-memory buffer; rows reach the database in
+    batches (one executemany per transaction) once batch_size rows are
+    buffered, from a timer thread every flush_interval seconds, and on
+    flush()/close(). close() also runs at interpreter exit. The database
+    runs in WAL mode so queries do not block writers.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._buffer = []
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS renders (id INTEGER PRIMARY KEY, {columns})")
+        for name in INDEXED:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_renders_{name} ON renders ({name})")
+        self._conn.commit()
+
+        self._closed = False
+        self._stop = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+        atexit.register(self.close)
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def log(self, metadata, **context):
+        """
+        Record one render. metadata is overlay_text's metadata dict; context
+        adds fields it does not carry (title, subtitle, platform,
+        background, render_seconds).
+        """
+        fields = dict(metadata, **context)
+        row = []
+        for name in COLUMN_NAMES:
+            if name == "ts":
+                row.append(fields.pop("ts", time.time()))
+            elif name == "extra":
+                row.append(json.dumps(fields, separators=(",", ":"), default=str) if fields else None)
+            else:
+                value = fields.pop(name, None)
+                row.append(int(bool(value)) if name in FLAGS and value is not None else value)
+
+        with self._lock:
+            self._buffer.append(row)
+            due = len(self._buffer) >= self.batch_size
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._closed:
+                return 0
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            placeholders = ", ".join("?" for _ in COLUMN_NAMES)
+            with self._conn:
+                self._conn.executemany(
+                    f"INSERT INTO renders ({', '.join(COLUMN_NAMES)}) VALUES ({placeholders})", rows
+                )
+        return len(rows)
+
+    def close(self):
+        if self._closed:
+            return
+        self._stop.set()
+        self._timer.join()
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+        atexit.unregister(self.close)
+
+    def query(self, sql, params=()):
+        """
+        Run a read query against the flushed log; returns a list of dicts.
+        """
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def flag_rate(self, flag="title_truncated", by="title_font", **filters):
+        """
+        How often a flag is set, grouped by a column, e.g.
+        flag_rate("title_truncated", by="title_font", platform="YouTube")
+        answers "how often does the title truncate per font on YouTube".
+        """
+        if flag not in FLAGS:
+            raise ValueError(f"unknown flag: {flag!r}")
+        if by not in COLUMN_NAMES:
+            raise ValueError(f"unknown column: {by!r}")
+        unknown = set(filters) - set(COLUMN_NAMES)
+        if unknown:
+            raise ValueError(f"unknown filter columns: {', '.join(sorted(unknown))}")
+
+        where = " AND ".join(f"{name} = ?" for name in filters)
+        return self.query(
+            f"SELECT {by} AS {by}, COUNT(*) AS renders, SUM({flag}) AS flagged, "
+            f"ROUND(AVG({flag}), 4) AS rate FROM renders "
+            f"{'WHERE ' + where if where else ''} GROUP BY {by} ORDER BY rate DESC, renders DESC",
+            tuple(filters.values()),
+        )
+
+
+if __name__ == "__main__":
+    # python -m backend.render_log renders.db [flag] [group-by column]
+    log = RenderLog(sys.argv[1])
+    flag = sys.argv[2] if len(sys.argv) > 2 else "title_truncated"
+    by = sys.argv[3] if len(sys.argv) > 3 else "title_font"
+    for row in log.flag_rate(flag, by=by):
+        # flagged/rate are NULL for groups logged without this flag
+        flagged = "-" if row["flagged"] is None else row["flagged"]
+        rate = "-" if row["rate"] is None else f"{row['rate']:.2%}"
+        print(f"{str(row[by]):<40} {row['renders']:>8} {flagged:>8} {rate:>8}")
+    log.close()
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from PIL import Image
+import hashlib
+import threading
+
+import numpy as np
+
+
+SALIENCY_SIDE = 64
+SMOOTH_SIGMA = 2.5
+SALIENCY_CACHE_SIZE = 64
+
+
+def _box3(arr):
+    # 3x3 mean with edge replication
+    padded = np.pad(arr, 1, mode="edge")
+    h, w = arr.shape
+    return sum(padded[dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3)) / 9.0
+
+
+def _gaussian_fft(arr, sigma):
+    # reflect-pad so the circular convolution does not wrap across edges
+    pad = int(3 * sigma) + 1
+    crop = (slice(pad, pad + arr.shape[0]), slice(pad, pad + arr.shape[1]))
+    arr = np.pad(arr, pad, mode="reflect")
+    fy = np.fft.fftfreq(arr.shape[0])[:, None]
+    fx = np.fft.rfftfreq(arr.shape[1])[None, :]
+    transfer = np.exp(-2 * (np.pi * sigma) ** 2 * (fx ** 2 + fy ** 2))
+    return np.fft.irfft2(np.fft.rfft2(arr) * transfer, s=arr.shape)[crop]
+
+
+def spectral_residual(lum, side=SALIENCY_SIDE, sigma=SMOOTH_SIGMA):
+    """
+    Spectral-residual saliency (Hou & Zhang, 2007) of a luma array.
+
+    The array is resampled so its longer side is `side`, which is the scale
+    the method works best at. The log amplitude spectrum minus its local
+    average is kept with the original phase, transformed back and smoothed.
+    Returns a map in [0, 1] the same shape as lum.
+    """
+    h, w = lum.shape
+    scale = side / max(h, w)
+    small_size = (max(8, round(w * scale)), max(8, round(h * scale)))
+    small = np.asarray(
+        Image.fromarray(np.asarray(lum, dtype=np.float32)).resize(small_size, Image.BILINEAR),
+        dtype=np.float64,
+    )
+
+    if small.std() < 1e-3:
+        # flat background: nothing stands out
+        return np.zeros_like(lum, dtype=np.float32)
+
+    # mirror-pad so the FFT's periodic wrap does not read the borders as edges
+    pad = side // 8
+    padded = np.pad(small, pad, mode="symmetric")
+
+    spectrum = np.fft.fft2(padded)
+    log_amp = np.log(np.abs(spectrum) + 1e-9)
+    residual = log_amp - _box3(log_amp)
+    sal = np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+    sal = _gaussian_fft(sal, sigma)[pad:pad + small.shape[0], pad:pad + small.shape[1]]
+
+    # robust normalization: the top percent of the map counts as fully salient
+    top = np.percentile(sal, 99)
+    sal = np.clip((sal - sal.mean()) / max(top - sal.mean(), 1e-9), 0.0, 1.0).astype(np.float32)
+
+    return np.asarray(Image.fromarray(sal).resize((w, h), Image.BILINEAR), dtype=np.float32)
+
+
+class SaliencyCache:
+    """
+    Small LRU of saliency maps keyed by a hash of the downsampled luma, so
+    repeated analyses of the same image (re-renders of one canvas) compute
+    the map once. Each platform export is cover-cropped to its own size
+    first, so its luma differs and it gets a map of its own.
+    """
+
+    def __init__(self, max_entries=SALIENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, lum):
+        lum = np.ascontiguousarray(lum, dtype=np.float32)
+        key = hashlib.sha1(lum.tobytes() + repr(lum.shape).encode()).hexdigest()
+        with self._lock:
+            sal = self._maps.get(key)
+            if sal is not None:
+                self._maps.move_to_end(key)
+                return sal
+
+        sal = spectral_residual(lum)
+        with self._lock:
+            self._maps[key] = sal
+            while len(self._maps) > self.max_entries:
+                self._maps.popitem(last=False)
+        return sal
+
+
+SALIENCY_CACHE = SaliencyCache()
+
+
+def saliency_map(lum):
+    return SALIENCY_CACHE.get(lum)
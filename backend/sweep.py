@@ -0,0 +1,189 @@
+from PIL import Image
+import argparse
+import csv
+import itertools
+import json
+import sys
+
+import numpy as np
+import torch
+
+from backend.layout import integral_image
+from backend.models import StageProfiler, generate_background, load_sd_model
+
+
+SCHEDULERS = {
+    "pndm": "PNDMScheduler",
+    "ddim": "DDIMScheduler",
+    "euler": "EulerDiscreteScheduler",
+    "euler_a": "EulerAncestralDiscreteScheduler",
+    "dpm": "DPMSolverMultistepScheduler",
+    "lms": "LMSDiscreteScheduler",
+}
+DTYPES = {"float32": torch.float32, "float16": torch.float16, "bfloat16": torch.bfloat16}
+
+SIMILARITY_SIZE = 128
+SSIM_WINDOW = 8
+
+
+def _box_mean(arr, k):
+    ii = integral_image(arr)
+    return (ii[k:, k:] - ii[:-k, k:] - ii[k:, :-k] + ii[:-k, :-k]) / (k * k)
+
+
+def image_similarity(a, b, size=SIMILARITY_SIZE, window=SSIM_WINDOW):
+    """
+    SSIM of two images on a small luma grid, with box windows. Cheap enough
+    to run on every sweep result; 1.0 means identical.
+    """
+    x = np.asarray(a.convert("L").resize((size, size), Image.BILINEAR), dtype=np.float64)
+    y = np.asarray(b.convert("L").resize((size, size), Image.BILINEAR), dtype=np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    mx, my = _box_mean(x, window), _box_mean(y, window)
+    vx = _box_mean(x * x, window) - mx ** 2
+    vy = _box_mean(y * y, window) - my ** 2
+    cxy = _box_mean(x * y, window) - mx * my
+
+    ssim = ((2 * mx * my + c1) * (2 * cxy + c2)) / ((mx ** 2 + my ** 2 + c1) * (vx + vy + c2))
+    return float(ssim.mean())
+
+
+def set_scheduler(pipe, name):
+    import diffusers
+
+    cls = getattr(diffusers, SCHEDULERS[name])
+    pipe.scheduler = cls.from_config(pipe.scheduler.config)
+
+
+def pareto_front(rows, keys=(("seconds", 1), ("peak_rss_delta_bytes", 1), ("similarity", -1))):
+    """
+    Mark rows not dominated on every key (sign 1: lower is better, -1:
+    higher is better). Rows that failed are never on the front.
+    """
+    ok = [r for r in rows if r.get("error") is None]
+    for r in rows:
+        r["pareto"] = False
+    for r in ok:
+        dominated = any(
+            all(o[k] * s <= r[k] * s for k, s in keys) and any(o[k] * s < r[k] * s for k, s in keys)
+            for o in ok if o is not r
+        )
+        r["pareto"] = not dominated
+    return rows
+
+
+def run_sweep(pipe, prompt, schedulers, steps, resolutions, dtypes, guidance_scale=7.5, seed=0,
+              reference_image=None, log=print):
+    """
+    Generate once for every (resolution, dtype, scheduler, steps) point with
+    a fixed seed, recording latency, peak memory and similarity to a
+    reference. Memory is compared as growth over the resident size when
+    the point started (peak_rss_delta_bytes), since the process keeps
+    memory from earlier points; CUDA peaks are reset for every point.
+    Without reference_image, one reference serves the whole sweep: the
+    first scheduler at the most steps in the first dtype at the largest
+    resolution (run first). image_similarity resizes both images, so every
+    resolution is compared against it and the Pareto front spans them all.
+    Returns a list of result dicts with a "pareto" flag.
+    """
+    rows = []
+    reference = reference_image
+    for (width, height) in sorted(resolutions, key=lambda size: size[0] * size[1], reverse=True):
+        grid = list(itertools.product(dtypes, schedulers, sorted(steps, reverse=True)))
+        for dtype, scheduler, num_steps in grid:
+            row = {
+                "scheduler": scheduler, "steps": num_steps, "width": width, "height": height,
+                "dtype": dtype, "seconds": None, "peak_rss_bytes": None, "peak_rss_delta_bytes": None,
+                "similarity": None, "error": None,
+            }
+            try:
+                pipe.to(dtype=DTYPES[dtype])
+                set_scheduler(pipe, scheduler)
+                profiler = StageProfiler()
+                with profiler.stage("generate"):
+                    image = generate_background(pipe, prompt, guidance_scale, num_steps,
+                                                width=width, height=height, seed=seed)
+                stage = profiler.stages[0]
+                row["seconds"] = stage["seconds"]
+                for key in ("peak_rss_bytes", "peak_rss_delta_bytes", "peak_cuda_bytes", "peak_cuda_delta_bytes"):
+                    if key in stage:
+                        row[key] = stage[key]
+                if reference is None:
+                    reference = image
+                    row["reference"] = True
+                row["similarity"] = round(image_similarity(image, reference), 4)
+            except Exception as e:
+                # e.g. float16 kernels missing on CPU; keep going with the rest of the grid
+                row["error"] = f"{type(e).__name__}: {e}"
+            rows.append(row)
+            log(format_row(row))
+    return pareto_front(rows)
+
+
+def format_row(row):
+    if row["error"]:
+        return f"{row['scheduler']:>8} {row['steps']:>4} {row['width']}x{row['height']:<5} {row['dtype']:>8}  failed: {row['error']}"
+    return (
+        f"{row['scheduler']:>8} {row['steps']:>4} {row['width']}x{row['height']:<5} {row['dtype']:>8}"
+        f" {row['seconds']:>8.2f}s {row['peak_rss_delta_bytes'] / 2 ** 20:>+8.0f}MB {row['similarity']:>7.4f}"
+        f"{'  *' if row.get('pareto') else ''}"
+    )
+
+
+def pareto_table(rows):
+    front = sorted((r for r in rows if r.get("pareto")), key=lambda r: r["seconds"])
+    header = f"{'sched':>8} {'steps':>4} {'size':<9} {'dtype':>8} {'latency':>9} {'mem':>10} {'ssim':>7}"
+    return "\n".join([header] + [format_row(r) for r in front])
+
+
+def _parse_resolutions(value):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep generation settings for cost versus quality.")
+    parser.add_argument("--model", default="runwayml/stable-diffusion-v1-5")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--prompt", default="minimal abstract poster background, soft gradient")
+    parser.add_argument("--schedulers", default="pndm,ddim,euler,dpm")
+    parser.add_argument("--steps", default="10,20,28")
+    parser.add_argument("--resolutions", default="512x512")
+    parser.add_argument("--dtypes", default="float32")
+    parser.add_argument("--guidance-scale", type=float, default=7.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reference", help="reference image; default is the costliest grid point")
+    parser.add_argument("--out", help="write results to a .csv or .json file")
+    args = parser.parse_args(argv)
+
+    schedulers = args.schedulers.split(",")
+    unknown = [s for s in schedulers if s not in SCHEDULERS]
+    if unknown:
+        parser.error(f"unknown schedulers: {', '.join(unknown)} (choose from {', '.join(SCHEDULERS)})")
+
+    pipe = load_sd_model(args.model, device=args.device, dtype=torch.float32)
+    reference = Image.open(args.reference).convert("RGB") if args.reference else None
+
+    rows = run_sweep(
+        pipe, args.prompt, schedulers, [int(s) for s in args.steps.split(",")],
+        _parse_resolutions(args.resolutions), args.dtypes.split(","),
+        guidance_scale=args.guidance_scale, seed=args.seed, reference_image=reference,
+        log=lambda line: print(line, file=sys.stderr),
+    )
+    print(pareto_table(rows))
+
+    if args.out:
+        if args.out.endswith(".json"):
+            with open(args.out, "w") as f:
+                json.dump(rows, f, indent=2)
+        else:
+            fields = sorted({key for row in rows for key in row})
+            with open(args.out, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    # python -m backend.sweep --model hf-internal-testing/tiny-stable-diffusion-torch --device cpu
+    main()
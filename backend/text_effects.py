@@ -0,0 +1,165 @@
+from PIL import Image, ImageColor, ImageDraw, ImageFilter
+import numpy as np
+
+from backend.glyph_atlas import GLYPH_ATLAS
+
+
+# effect sizes relative to the font size
+SHADOW_OFFSET_RATIO = 0.04
+SHADOW_BLUR_RATIO = 0.06
+SHADOW_OPACITY = 0.75
+OUTLINE_RATIO = 0.04
+GLOW_RATIO = 0.12
+GLOW_OPACITY = 0.6
+
+
+def _font_size(font):
+    return getattr(font, "size", 12)
+
+
+def _rgb(color):
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    return tuple(color[:3])
+
+
+def effect_layers(effect, font_size, effect_color="black"):
+    """
+    Describe the layers drawn beneath the text fill for a contrast effect.
+    Each layer is a dict with offset, dilate, blur (pixels), opacity and color.
+    """
+    offset = max(2, round(font_size * SHADOW_OFFSET_RATIO))
+    outline = max(2, round(font_size * OUTLINE_RATIO))
+
+    if effect == "shadow":
+        return [{"offset": (offset, offset), "dilate": 0, "blur": max(1, round(font_size * SHADOW_BLUR_RATIO)),
+                 "opacity": SHADOW_OPACITY, "color": effect_color}]
+    if effect == "hard_shadow":
+        return [{"offset": (offset, offset), "dilate": 0, "blur": 0, "opacity": 1.0, "color": effect_color}]
+    if effect == "stroke":
+        return [{"offset": (0, 0), "dilate": outline, "blur": 0, "opacity": 1.0, "color": effect_color}]
+    if effect == "glow":
+        return [{"offset": (0, 0), "dilate": outline, "blur": max(2, round(font_size * GLOW_RATIO)),
+                 "opacity": GLOW_OPACITY, "color": effect_color}]
+    return []
+
+
+def _running_max(arr, radius):
+    """
+    Max over a window of 2 * radius + 1 along the last axis, zero-padded.
+    Windows double in length each pass and the last pass joins two
+    overlapping ones, so the cost grows with log(radius), not radius.
+    """
+    size = 2 * radius + 1
+    out = np.pad(arr, [(0, 0)] * (arr.ndim - 1) + [(radius, radius)])
+    length = 1
+    while length * 2 <= size:
+        out = np.maximum(out[..., :-length], out[..., length:])
+        length *= 2
+    if length < size:
+        out = np.maximum(out[..., :length - size], out[..., size - length:])
+    return out
+
+
+def _dilate(mask, radius):
+    # square max filter as two separable 1-D passes (same result as MaxFilter(2 * radius + 1))
+    arr = _running_max(np.asarray(mask), radius)
+    return Image.fromarray(np.ascontiguousarray(_running_max(arr.T, radius).T))
+
+
+def _derive_mask(mask, layer):
+    if layer["dilate"]:
+        mask = _dilate(mask, layer["dilate"])
+    if layer["blur"]:
+        mask = mask.filter(ImageFilter.GaussianBlur(layer["blur"]))
+
+    arr = np.asarray(mask, dtype=np.float32) / 255.0
+    dx, dy = layer["offset"]
+    if dx or dy:
+        shifted = np.zeros_like(arr)
+        shifted[dy:, dx:] = arr[:arr.shape[0] - dy, :arr.shape[1] - dx]
+        arr = shifted
+    return arr
+
+
+def render_text_block(image, positions, font, fill, effect="none", effect_color="black"):
+    """
+    Draw positioned lines ([(line, x, y), ...]) sharing one font and style
+    onto an RGBA image in place.
+
+    The glyph coverage mask is rasterized once for the whole block. Shadows,
+    outlines and glows are derived from that mask, and every layer is
+    composited in a single alpha_composite. All work happens inside the
+    block's bounding box plus the effect margin, so the cost does not grow
+    with the canvas size.
+    """
+    if not positions:
+        return
+
+    draw = ImageDraw.Draw(image)
+    boxes = [draw.textbbox((x, y), line, font=font) for line, x, y in positions]
+
+    layers = effect_layers(effect, _font_size(font), effect_color)
+    margin = max(
+        [layer["dilate"] + 3 * layer["blur"] + max(layer["offset"]) for layer in layers],
+        default=0,
+    ) + 1
+
+    x0 = max(0, min(b[0] for b in boxes) - margin)
+    y0 = max(0, min(b[1] for b in boxes) - margin)
+    x1 = min(image.width, max(b[2] for b in boxes) + margin)
+    y1 = min(image.height, max(b[3] for b in boxes) + margin)
+    if x1 <= x0 or y1 <= y0:
+        return
+
+    if getattr(font, "path", None):
+        # compose from cached glyph masks instead of re-rasterizing the line
+        coverage = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        for line, x, y in positions:
+            GLYPH_ATLAS.blit_line(coverage, line, font, x - x0, y - y0)
+        mask = Image.fromarray(coverage)
+    else:
+        mask = Image.new("L", (x1 - x0, y1 - y0), 0)
+        mask_draw = ImageDraw.Draw(mask)
+        for line, x, y in positions:
+            mask_draw.text((x - x0, y - y0), line, font=font, fill=255)
+
+    # composite effect layers bottom-up, then the fill, in premultiplied space
+    out_rgb = np.zeros(mask.size[::-1] + (3,), dtype=np.float32)
+    out_a = np.zeros(mask.size[::-1], dtype=np.float32)
+
+    stack = [(_derive_mask(mask, layer) * layer["opacity"], _rgb(layer["color"])) for layer in layers]
+    stack.append((np.asarray(mask, dtype=np.float32) / 255.0, _rgb(fill)))
+
+    for alpha, rgb in stack:
+        out_rgb = np.asarray(rgb, dtype=np.float32) * alpha[..., None] + out_rgb * (1.0 - alpha[..., None])
+        out_a = alpha + out_a * (1.0 - alpha)
+
+    safe_a = np.where(out_a > 0, out_a, 1.0)
+    rgba = np.empty(out_a.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = np.clip(out_rgb / safe_a[..., None], 0, 255).astype(np.uint8)
+    rgba[..., 3] = np.clip(out_a * 255.0, 0, 255).astype(np.uint8)
+
+    image.alpha_composite(Image.fromarray(rgba), dest=(x0, y0))
+
+
+def render_styled_lines(image, positions, font, styles, fill_for=None):
+    """
+    Render lines with per-line styles (as returned by
+    contrast.choose_line_styles), batching consecutive lines that share a
+    style into one block. fill_for maps a style to the fill colour and
+    defaults to the style's text_color.
+    """
+    block, block_key = [], None
+
+    for position, style in zip(positions, styles):
+        fill = fill_for(style) if fill_for else style["text_color"]
+        key = (fill, style["effect"], style["effect_color"])
+        if block and key != block_key:
+            render_text_block(image, block, font, *block_key)
+            block = []
+        block.append(position)
+        block_key = key
+
+    if block:
+        render_text_block(image, block, font, *block_key)
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageFilter
+import os
+
+from backend.postprocessing import cover_box
+
+
+TILE_SIZE = 256
+SHARPEN = {"radius": 1.2, "percent": 60, "threshold": 2}
+
+
+def _tiles(W, H, tile):
+    for y in range(0, H, tile):
+        for x in range(0, W, tile):
+            yield x, y, min(x + tile, W), min(y + tile, H)
+
+
+def upscale_tiled(image, size, box=None, tile=TILE_SIZE, workers=None, sharpen=True):
+    """
+    Resize image (or its box region) to size on the CPU, tile by tile.
+
+    Each output tile is resampled with LANCZOS straight from the source
+    region it maps to, so tiles join without seams, and is optionally
+    sharpened with an unsharp mask over a margin that is cropped away
+    afterwards. Pillow releases the GIL while resampling and filtering, so
+    tiles run in parallel on a thread pool.
+    """
+    image = image.convert("RGB")
+    W, H = size
+    sx0, sy0, sx1, sy1 = box or (0, 0, image.width, image.height)
+    scale_x = (sx1 - sx0) / W
+    scale_y = (sy1 - sy0) / H
+    margin = int(3 * SHARPEN["radius"]) + 1 if sharpen else 0
+
+    def render(out_box):
+        # expand by the sharpening margin, clamped to the output
+        x0, y0, x1, y1 = out_box
+        mx0, my0 = max(0, x0 - margin), max(0, y0 - margin)
+        mx1, my1 = min(W, x1 + margin), min(H, y1 + margin)
+        src = (sx0 + mx0 * scale_x, sy0 + my0 * scale_y, sx0 + mx1 * scale_x, sy0 + my1 * scale_y)
+        piece = image.resize((mx1 - mx0, my1 - my0), Image.LANCZOS, box=src)
+        if sharpen:
+            piece = piece.filter(ImageFilter.UnsharpMask(**SHARPEN))
+        return out_box, piece.crop((x0 - mx0, y0 - my0, x1 - mx0, y1 - my0))
+
+    out = Image.new("RGB", (W, H))
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for (x0, y0, _, _), piece in pool.map(render, _tiles(W, H, tile)):
+            out.paste(piece, (x0, y0))
+    return out
+
+
+def upscale_cover(image, size, **kwargs):
+    """
+    upscale_tiled onto the centred crop of image that covers size, i.e. the
+    same framing as cover_resize, in one resampling pass.
+    """
+    return upscale_tiled(image, size, box=cover_box(image.width, image.height, *size), **kwargs)
@@ -2,6 +2,7 @@ import sys
 import os
 import time
 import io
+import tempfile
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT_DIR not in sys.path:
@@ -10,12 +11,58 @@ if ROOT_DIR not in sys.path:
 # frontend
 import streamlit as st
 from PIL import Image
-from backend.postprocessing import overlay_text, save_layout_metadata, export_with_text
+from backend.postprocessing import overlay_text, export_with_text, make_thumbnails, PLATFORM_SIZES
+from backend.output_sink import OutputSink
+from backend.render_log import RenderLog
+from backend.animation import export_animated
 from backend.models import VARIANTS 
+from backend.image_store import ImageStore
+from backend.catalog import BackgroundCatalog
+from backend.layout import LayoutStats
+from backend.font_fit import recommend_fonts
+from backend.readability import rank_catalog
 # from backend.models import generate_background_from_prompt_api (.. for API version)
 
 
 st.set_page_config(page_title="AI Creative Design Copilot (MVP)", layout="wide")
+
+
+@st.cache_resource
+def get_image_store():
+    # shared by every session; sessions only keep handles into it
+    return ImageStore()
+
+
+image_store = get_image_store()
+
+
+@st.cache_resource
+def get_output_sink():
+    # saved posters are written by a background thread; the folder is size- and age-capped
+    return OutputSink("assets/outputs")
+
+
+output_sink = get_output_sink()
+
+
+@st.cache_resource
+def get_render_log():
+    # every render's metadata, queryable with RenderLog.flag_rate
+    return RenderLog("assets/render_log.db")
+
+
+render_log = get_render_log()
+
+
+def release_variants():
+    handles = [v["image_handle"] for v in st.session_state.generated_variants]
+    image_store.release(*handles)
+    for handle in handles:
+        st.session_state.get("saved_outputs", {}).pop(handle, None)
+    logged = st.session_state.get("logged_exports", set())
+    logged.difference_update({key for key in logged if key[0] in handles})
+    st.session_state.generated_variants = []
+
 st.title("AI Creative Design Assistant — MVP")
 st.divider()
 
@@ -112,6 +159,20 @@ st.sidebar.markdown(
     unsafe_allow_html=True
 )
 
+# Measure every font against the current text without rendering posters
+canvas_size = st.session_state.get("base_background_size", (1080, 1080))
+
+font_ranking = recommend_fonts(FONT_OPTIONS, title, subtitle, canvas_size)
+# with every font scoring the same there is nothing to suggest
+if len({r["score"] for r in font_ranking}) > 1:
+    st.sidebar.caption(
+        "Suggested for this text: "
+        + ", ".join(
+            f"{r['name']}{' (overflows)' if r['title_overflow'] else ''}"
+            for r in font_ranking[:3]
+        )
+    )
+
 st.sidebar.divider()
 st.sidebar.subheader("Background")
 
@@ -134,20 +195,39 @@ if bg_source == "Upload image":
 # Show available sample images
 img_dir = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_images")
 img_dir = os.path.abspath(img_dir)
-images = []
-if os.path.exists(img_dir):
-    images = [f for f in os.listdir(img_dir) if f.lower().endswith((".png", ".jpg", ".jpeg"))]
+
+
+@st.cache_resource
+def get_background_catalog():
+    return BackgroundCatalog(img_dir, background=True)
+
+
+catalog = get_background_catalog()
+catalog.refresh()
+images = catalog.names()
 
 
 
 selected = None
 
 if bg_source == "Use sample image":
+    # keep the list order stable (reordering would reset the selection); just suggest
+    if images:
+        background_ranking = rank_catalog(
+            catalog, title, subtitle, title_font_path, subtitle_font_path
+        )
+        st.sidebar.caption(
+            "Most readable for this text: " + ", ".join(r["name"] for r in background_ranking[:3])
+        )
+    if catalog.pending:
+        st.sidebar.caption(f"Analyzing {catalog.pending} new background(s)...")
     bg_options = ["(Generate from prompt)"] + images
     selected = st.sidebar.selectbox(
         "Choose a background image",
         bg_options
     )
+    if selected in images:
+        st.sidebar.image(catalog.thumbnail(selected), width=260)
               
 
 # st.sidebar.divider()
@@ -179,7 +259,7 @@ img = None
 #             st.session_state.generated_bg = False
 
 if generate:
-    st.session_state.generated_variants = []
+    release_variants()
 
     # CASE 1 — Uploaded image
     if bg_source == "Upload image":
@@ -195,8 +275,7 @@ if generate:
             st.info("Please select a sample background image.")
             st.stop()
         elif selected:
-            img_path = os.path.join(img_dir, selected)
-            img = Image.open(img_path).convert("RGB")
+            img = Image.open(catalog.path(selected)).convert("RGB")
 
     if img is None:
         st.stop()
@@ -204,23 +283,38 @@ if generate:
     if img is not None:
         variants = []
 
-        st.session_state.base_background = img.copy()
+        image_store.release(st.session_state.get("base_background_handle"))
+        st.session_state.base_background_handle = image_store.put(img, thumbnail_widths=None)
+        st.session_state.base_background_size = img.size
+
+        # catalogued samples come with precomputed analysis; uploads are analyzed once here
+        st.session_state.base_background_name = selected if bg_source == "Use sample image" else None
+        layout_stats = (
+            catalog.layout_stats(selected)
+            if st.session_state.base_background_name
+            else LayoutStats(img)
+        )
 
         for variant in VARIANTS:
+            render_start = time.perf_counter()
             out, meta = overlay_text(
                 img,
                 title=title,
                 subtitle=subtitle,
                 title_font_path=title_font_path,
                 subtitle_font_path=subtitle_font_path,
+                layout_stats=layout_stats,
                 
                 # variant={**variant,
                 #     "vertical_adjust": vertical_adjust,
                 #     "scale_adjust": scale_adjust}
             )
+            render_log.log(meta, title=title, subtitle=subtitle,
+                           background=st.session_state.base_background_name,
+                           render_seconds=time.perf_counter() - render_start)
             variants.append({
                 "name": variant["name"],
-                "image": out,          
+                "image_handle": image_store.put(out),
                 "meta": meta,
                 "variant": variant    
             })
@@ -231,30 +325,42 @@ if generate:
 # Auto-update variants when only text changes (background already fixed)
 if (
     text_changed
-    and "base_background" in st.session_state
+    and st.session_state.get("base_background_handle") in image_store
     and not generate
 ):
-    img = st.session_state.base_background.copy()
+    img = image_store.get(st.session_state.base_background_handle)
+    release_variants()
     variants = []
 
+    base_name = st.session_state.get("base_background_name")
+    layout_stats = catalog.layout_stats(base_name) if base_name in images else LayoutStats(img)
+
     for variant in VARIANTS:
+        render_start = time.perf_counter()
         out, meta = overlay_text(
             img,
             title=title,
             subtitle=subtitle,
             title_font_path=title_font_path,
             subtitle_font_path=subtitle_font_path,
-            variant=variant
+            variant=variant,
+            layout_stats=layout_stats
         )
+        render_log.log(meta, title=title, subtitle=subtitle, background=base_name,
+                       render_seconds=time.perf_counter() - render_start)
         variants.append({
             "name": variant["name"],
-            "image": out,
+            "image_handle": image_store.put(out),
             "meta": meta,
             "variant": variant
         })
 
     st.session_state.generated_variants = variants
 
+# variants left idle past the image store's retention are gone; regenerate instead of failing
+if any(v["image_handle"] not in image_store for v in st.session_state.generated_variants):
+    release_variants()
+
 if st.session_state.generated_variants:
     with right_col:
         st.subheader("Choose a Design Variant")
@@ -265,7 +371,7 @@ if st.session_state.generated_variants:
         for col, v in zip(cols, variants):
             with col:
                 st.markdown(f"**{v['name']}**")
-                st.image(v["image"], width=260)
+                st.image(image_store.thumbnail(v["image_handle"], 260), width=260)
                 st.caption(
                     f"{v['meta']['title_font']} | {v['meta']['text_color']} | {v['meta']['layout']}"
                 )
@@ -289,7 +395,7 @@ if st.session_state.generated_variants:
             st.stop()
 
 
-        final_image = selected["image"]          # preview image
+        final_image = image_store.get(selected["image_handle"])  # preview image
         final_meta = selected["meta"]
         selected_variant_config = selected["variant"]  # variant dict
 
@@ -310,54 +416,64 @@ if st.session_state.generated_variants:
 
             st.write(f"**Layout:** {final_meta['layout']}")
 
-            output_dir = "assets/outputs"
-            os.makedirs(output_dir, exist_ok=True)
-            filename = f"composed_{int(time.time())}.png"
-            out_path = os.path.join(output_dir, filename)
-            final_image.save(out_path)
-
-            meta_path = out_path.replace(".png", ".json")
-            save_layout_metadata(meta_path, {
-                "title": title,
-                "subtitle": subtitle,
-                **final_meta
-            })
-
-            with open(out_path, "rb") as f:
-                st.download_button(
-                    "Download composed PNG",
-                    f.read(),
-                    file_name=filename
-                )
+            # encode and save each variant once, not on every rerun; session state keeps only the name
+            saved_outputs = st.session_state.setdefault("saved_outputs", {})
+            png_bytes = image_store.encoded(selected["image_handle"], "PNG")
+            if selected["image_handle"] not in saved_outputs:
+                filename = f"composed_{int(time.time())}_{selected['image_handle'][:8]}.png"
+                saved_outputs[selected["image_handle"]] = filename
+
+                output_sink.submit(filename, png_bytes)
+                output_sink.submit_json(filename.replace(".png", ".json"), {
+                    "title": title,
+                    "subtitle": subtitle,
+                    **final_meta
+                })
+
+            st.download_button(
+                "Download composed PNG",
+                png_bytes,
+                file_name=saved_outputs[selected["image_handle"]],
+                mime="image/png"
+            )
             
-            if "base_background" not in st.session_state:
+            if st.session_state.get("base_background_handle") not in image_store:
                 st.error("Background image not found.")
                 st.stop()
 
-            exports = export_with_text(
-                st.session_state.base_background,
+            exports, export_meta = export_with_text(
+                image_store.get(st.session_state.base_background_handle),
                 title,
                 subtitle,
                 title_font_path,
                 subtitle_font_path,
-                selected_variant_config
+                selected_variant_config,
+                with_metadata=True
             )
+            # exports are rebuilt on every rerun; log them once per variant and text
+            logged_exports = st.session_state.setdefault("logged_exports", set())
+            export_key = (selected["image_handle"], title, subtitle, title_font_path, subtitle_font_path)
+            if export_key not in logged_exports:
+                logged_exports.add(export_key)
+                for platform_name, meta in export_meta.items():
+                    render_log.log(meta, title=title, subtitle=subtitle, platform=platform_name,
+                                   background=st.session_state.get("base_background_name"))
 
 
 
 
             st.subheader("Export for Social Media")
 
-            tab_preview, tab_instagram, tab_linkedin, tab_youtube = st.tabs(
-                ["Preview", "Instagram", "LinkedIn", "YouTube"]
+            tab_preview, tab_instagram, tab_linkedin, tab_youtube, tab_motion = st.tabs(
+                ["Preview", "Instagram", "LinkedIn", "YouTube", "Motion"]
             )
 
             with tab_preview:
-                st.image(final_image, width=420)
+                st.image(image_store.thumbnail(selected["image_handle"], 420), width=420)
                 st.caption("Original poster (square format)")
 
             with tab_instagram:
-                st.image(exports["Instagram"], width=420)
+                st.image(make_thumbnails(exports["Instagram"], (420,))[420], width=420)
 
                 buf = io.BytesIO()
                 exports["Instagram"].save(buf, format="PNG")
@@ -370,7 +486,7 @@ if st.session_state.generated_variants:
 
             
             with tab_linkedin:
-                st.image(exports["LinkedIn"], width=420)
+                st.image(make_thumbnails(exports["LinkedIn"], (420,))[420], width=420)
 
                 buf = io.BytesIO()
                 exports["LinkedIn"].save(buf, format="PNG")
@@ -383,7 +499,7 @@ if st.session_state.generated_variants:
  
             
             with tab_youtube:
-                st.image(exports["YouTube"], width=420)
+                st.image(make_thumbnails(exports["YouTube"], (420,))[420], width=420)
 
                 buf = io.BytesIO()
                 exports["YouTube"].save(buf, format="PNG")
@@ -393,6 +509,35 @@ if st.session_state.generated_variants:
                     file_name="youtube.png",
                     mime="image/png"
                 )
+
+            with tab_motion:
+                motion_platform = st.selectbox("Platform", list(PLATFORM_SIZES.keys()), key="motion_platform")
+                motion = st.selectbox("Motion", ["zoom", "pan"], key="motion_type")
+                motion_fmt = st.selectbox("Format", ["gif", "mp4", "webp"], key="motion_format")
+
+                if st.button("Render animation"):
+                    with st.spinner("Rendering animation..."):
+                        with tempfile.TemporaryDirectory() as tmp_dir:
+                            anim_path, _ = export_animated(
+                                image_store.get(st.session_state.base_background_handle),
+                                title,
+                                subtitle,
+                                title_font_path,
+                                subtitle_font_path,
+                                selected_variant_config,
+                                os.path.join(tmp_dir, f"poster.{motion_fmt}"),
+                                platform=motion_platform,
+                                motion=motion,
+                            )
+                            with open(anim_path, "rb") as f:
+                                anim_bytes = f.read()
+
+                    st.download_button(
+                        f"Download {motion_fmt.upper()}",
+                        anim_bytes,
+                        file_name=f"{motion_platform.lower()}_{motion}.{motion_fmt}",
+                        mime={"gif": "image/gif", "mp4": "video/mp4", "webp": "image/webp"}[motion_fmt]
+                    )
             
             if final_meta.get("emoji_removed"):
                 st.warning("Emojis are currently not supported and were removed.")